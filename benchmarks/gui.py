@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark the construction of the plugin's panel and forms
+
+The benchmarks run in FSLeyes with the harness of the GUI tests, a display is needed (``xvfb-run`` on a headless
+machine). They measure:
+
+- the construction of ``STControlPanel`` and the number of wx windows it creates,
+- the construction of each tab and the number of wx windows it creates,
+- the latency of ``on_choice`` and of the layout it asks for, for each choice of each dropdown,
+- the latency of ``RunComponent.get_run_args`` for each run component that is built.
+
+Timings are in seconds, the median of ``--repeat`` samples is reported along with the samples.
+
+Usage:
+    xvfb-run -a python benchmarks/gui.py [--repeat N] [--output FILE]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# The harness of the GUI tests lives in the test package at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wx  # noqa: E402
+
+from test import realYield, run_with_orthopanel  # noqa: E402
+from fsleyes_plugin_shimming_toolbox.components.component import RunArgumentErrorST  # noqa: E402
+from fsleyes_plugin_shimming_toolbox.components.run_component import RunComponent  # noqa: E402
+from fsleyes_plugin_shimming_toolbox.st_plugin import NotebookTerminal, PlaceholderPage, STControlPanel  # noqa: E402
+
+OUTPUT = 'benchmark_gui.json'
+
+
+def count_windows(window):
+    """Returns the number of windows in ``window``, itself included."""
+    return 1 + sum(count_windows(child) for child in window.GetChildren())
+
+
+def summarize(samples):
+    return {'median': statistics.median(samples), 'samples': samples}
+
+
+def flush_layout(tab):
+    """Lay out ``tab`` now if it asked for it, returns the time it took."""
+    start = time.perf_counter()
+    if tab.layout_pending:
+        tab.do_layout()
+    return time.perf_counter() - start
+
+
+def get_notebook(panel):
+    for child in panel.GetChildren():
+        if isinstance(child, NotebookTerminal):
+            return child
+    raise RuntimeError("Could not find the notebook of the Shimming Toolbox panel")
+
+
+def get_tab_classes(nb_terminal):
+    """Returns the tab classes of the notebook in the order of the pages."""
+    tab_classes = []
+    for index in range(nb_terminal.GetPageCount()):
+        page = nb_terminal.GetPage(index)
+        tab_classes.append(page.tab_class if isinstance(page, PlaceholderPage) else type(page))
+    return tab_classes
+
+
+def get_choices(window):
+    """Returns the wx.Choice widgets of a tab, the tab's own choice box first."""
+    choices = []
+    for child in window.GetChildren():
+        if isinstance(child, wx.Choice):
+            choices.append(child)
+        choices.extend(get_choices(child))
+    return choices
+
+
+def get_run_components(tab):
+    return [obj for obj in gc.get_objects() if isinstance(obj, RunComponent) and obj.panel is tab]
+
+
+def bench_panel(view, repeat):
+    samples = []
+    windows = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        panel = view.togglePanel(STControlPanel)
+        samples.append(time.perf_counter() - start)
+        windows = count_windows(panel)
+        view.togglePanel(STControlPanel)
+        realYield()
+    return {**summarize(samples), 'windows': windows}
+
+
+def bench_tab(nb_terminal, tab_class, repeat):
+    """Build ``tab_class`` ``repeat`` times, the last tab is returned for the other benchmarks."""
+    samples = []
+    tab = None
+    for _ in range(repeat):
+        if tab is not None:
+            tab.Destroy()
+            realYield()
+        start = time.perf_counter()
+        tab = tab_class(nb_terminal)
+        flush_layout(tab)
+        samples.append(time.perf_counter() - start)
+    tab.Hide()
+    return {**summarize(samples), 'windows': count_windows(tab)}, tab
+
+
+def bench_choices(tab, repeat):
+    """Go through every selection of every dropdown of the tab, the first pass also builds the lazy sizers."""
+    results = {}
+    for _ in range(repeat):
+        # Selections build new dropdowns, look for them on every pass
+        for choice in get_choices(tab):
+            if not choice:
+                continue
+            initial = choice.GetSelection()
+            for index in range(choice.GetCount()):
+                choice.SetSelection(index)
+                event = wx.CommandEvent(wx.EVT_CHOICE.typeId, choice.GetId())
+                event.SetEventObject(choice)
+                event.SetInt(index)
+                start = time.perf_counter()
+                choice.GetEventHandler().ProcessEvent(event)
+                elapsed = time.perf_counter() - start
+                layout = flush_layout(tab)
+
+                key = (choice.GetName(), choice.GetString(index))
+                result = results.setdefault(key, {'on_choice': [], 'layout': []})
+                result['on_choice'].append(elapsed)
+                result['layout'].append(layout)
+
+            if initial >= 0:
+                choice.SetSelection(initial)
+                event = wx.CommandEvent(wx.EVT_CHOICE.typeId, choice.GetId())
+                event.SetEventObject(choice)
+                choice.GetEventHandler().ProcessEvent(event)
+                flush_layout(tab)
+
+    return [{'dropdown': name, 'selection': selection,
+             'on_choice': summarize(result['on_choice']), 'layout': summarize(result['layout'])}
+            for (name, selection), result in results.items()]
+
+
+def bench_run_args(tab, repeat):
+    results = []
+    for run_component in get_run_components(tab):
+        samples = []
+        error = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                run_component.get_run_args(run_component.st_function)
+            except RunArgumentErrorST as err:
+                # Required inputs are empty, the arguments are gathered up to the first missing one
+                error = str(err)
+            samples.append(time.perf_counter() - start)
+            run_component.output = None
+            run_component.load_in_overlay = []
+        results.append({'st_function': run_component.st_function, **summarize(samples), 'error': error})
+    return results
+
+
+def run_benchmarks(view, overlayList, displayCtx, repeat):
+    results = {
+        'python': platform.python_version(),
+        'wx': wx.version(),
+        'repeat': repeat,
+        'panel': bench_panel(view, repeat),
+        'tabs': {},
+    }
+
+    panel = view.togglePanel(STControlPanel)
+    realYield()
+    nb_terminal = get_notebook(panel)
+    for tab_class in get_tab_classes(nb_terminal):
+        construction, tab = bench_tab(nb_terminal, tab_class, repeat)
+        results['tabs'][tab_class.__name__] = {
+            'construction': construction,
+            'on_choice': bench_choices(tab, repeat),
+            'get_run_args': bench_run_args(tab, repeat),
+        }
+        tab.Destroy()
+        realYield()
+
+    return results
+
+
+def print_summary(results):
+    panel = results['panel']
+    print(f"STControlPanel: {panel['median'] * 1000:.1f} ms, {panel['windows']} windows")
+    for name, tab in results['tabs'].items():
+        construction = tab['construction']
+        slowest = max(tab['on_choice'], key=lambda item: item['on_choice']['median'] + item['layout']['median'],
+                      default=None)
+        print(f"{name}: {construction['median'] * 1000:.1f} ms, {construction['windows']} windows")
+        if slowest is not None:
+            total = slowest['on_choice']['median'] + slowest['layout']['median']
+            print(f"    slowest choice: {slowest['dropdown']} -> {slowest['selection']}: {total * 1000:.1f} ms")
+        for run_args in tab['get_run_args']:
+            print(f"    get_run_args {run_args['st_function']}: {run_args['median'] * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=5, help="Number of samples of each measure.")
+    parser.add_argument('--output', default=OUTPUT, help=f"JSON file the results are written to, default: {OUTPUT}")
+    args = parser.parse_args()
+
+    results = run_with_orthopanel(run_benchmarks, args.repeat)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_summary(results)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Report the import time of the plugin
+
+FSLeyes imports the plugin when it starts, even if the Shimming Toolbox panel is never opened. This script imports
+``wx`` and the FSLeyes modules the plugin depends on first, then the plugin, with ``python -X importtime``. It reports
+the cost of the plugin on top of FSLeyes and the slowest modules it imported.
+
+Usage:
+    python benchmarks/importtime.py [--top N] [--check]
+
+With ``--check``, the script exits with an error if one of ``HEAVY_MODULES`` was imported by the plugin.
+"""
+
+import argparse
+import subprocess
+import sys
+
+PLUGIN_MODULE = 'fsleyes_plugin_shimming_toolbox.st_plugin'
+# Modules already imported by FSLeyes, they are not part of the cost of the plugin
+PRELOAD = ['wx', 'numpy', 'fsleyes.controls.controlpanel', 'fsleyes.views.canvaspanel', 'fsleyes.actions.loadoverlay']
+# Modules that must only be imported when they are used
+HEAVY_MODULES = ['shimmingtoolbox', 'nibabel', 'imageio', 'scipy']
+
+
+def parse_importtime(stderr):
+    """Parse the output of ``python -X importtime``.
+
+    Returns:
+        list: Tuples ``(module, self_us, cumulative_us)`` in the order they finished importing.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        imports.append((module.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def measure():
+    code = '; '.join(f"import {module}" for module in PRELOAD)
+    code += f"; print('--- plugin ---', file=__import__('sys').stderr, flush=True); import {PLUGIN_MODULE}"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not import {PLUGIN_MODULE}:\n{result.stderr}")
+    return parse_importtime(result.stderr.split('--- plugin ---', 1)[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--top', type=int, default=15, help="Number of modules to list.")
+    parser.add_argument('--check', action='store_true', help="Fail if a heavy module is imported with the plugin.")
+    args = parser.parse_args()
+
+    imports = measure()
+    total_us = sum(self_us for _, self_us, _ in imports)
+    print(f"Import of {PLUGIN_MODULE} on top of FSLeyes: {total_us / 1000:.1f} ms, {len(imports)} modules\n")
+    print(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module")
+    for module, self_us, cumulative_us in sorted(imports, key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}  {module}")
+
+    heavy = sorted({module for module, _, _ in imports if module.split('.')[0] in HEAVY_MODULES})
+    if heavy:
+        print(f"\nHeavy modules imported with the plugin: {', '.join(heavy)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ from typing import Mapping
 from hashlib import md5
 
 from fsleyes_plugin_shimming_toolbox import __dir_testing__
+from fsleyes_plugin_shimming_toolbox import result_cache
 from shimmingtoolbox.cli.download_data import download_data
 
 logger = logging.getLogger(__name__)
@@ -31,6 +32,13 @@ def test_data_path_fixture():
     return test_data_path()
 
 
+@pytest.fixture(autouse=True)
+def result_cache_in_tmp_path(tmp_path, monkeypatch):
+    """The GUI tests run the CLIs: cache their outputs in a temporary folder rather than in the cache of the user, so
+    that a test never restores the outputs of a previous session instead of running the CLI."""
+    monkeypatch.setattr(result_cache, '_cache', result_cache.ResultCache(os.path.join(tmp_path, 'result_cache')))
+
+
 def pytest_sessionstart():
     """Download shimming-toolbox testing_data prior to test collection."""
     logger.info("Downloading shimming-toolbox test data")
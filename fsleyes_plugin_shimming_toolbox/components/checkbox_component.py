@@ -83,14 +83,18 @@ class CheckboxComponent(Component):
             self.sizer.Add(child['object'].sizer, 0, wx.EXPAND)
 
     def on_choice(self, event):
+        self.resolve()
+        self.panel.request_layout()
+
+    def resolve(self):
+        """Show the children of the checked checkboxes, the children that are shown resolve their own items"""
         childrens_to_show = self.get_children_to_show()
         for child in self.children:
             if child['object'] in childrens_to_show:
                 child['object'].sizer.ShowItems(True)
+                child['object'].resolve()
             else:
                 child['object'].sizer.ShowItems(False)
-        self.panel.SetVirtualSize(self.panel.sizer_run.GetMinSize())
-        self.panel.Layout()
 
     def get_children_to_show(self):
         """Get the children to show based on the checkbox selection"""
@@ -3,6 +3,8 @@
 
 import abc
 
+from fsleyes_plugin_shimming_toolbox.components.help_index import get_help_index
+
 
 class Component:
     def __init__(self, panel, list_components=[]):
@@ -22,9 +24,20 @@ class Component:
     def get_command(self):
         raise NotImplementedError
 
+    def resolve(self):
+        """Show the items of the component that are selected, components without nested components have nothing to do"""
+        pass
+
 
 def get_help_text(cli_function, name):
-    """ Returns the help text of a cli function depending on its name. """
+    """ Returns the help text of a cli function depending on its name.
+
+    ``cli_function`` is either a click command or a ``"module:attribute"`` reference to one. References are looked up
+    in the persisted help index and don't import the CLI.
+    """
+    if isinstance(cli_function, str):
+        return get_help_index().get(cli_function, name)
+
     for param in cli_function.params:
         # Try different versions of the input dashes
         for dashes in ['', '-', '--']:
@@ -43,10 +43,12 @@ class DropdownComponent(Component):
         self.positions = {}
         self.input_text_boxes = {}
 
-        # If there is a dropdown parent, it needs to be added after instanciantion with self.add_dropdown_parent(parent)
+        # The parent is set by the dropdown this one is nested in
         self.dropdown_parent = None
 
         self.dropdown_children = self.get_dropdown_children()
+        for child in self.dropdown_children:
+            child.add_dropdown_parent(self)
         self.sizer = self.create_sizer()
         self.dropdown_choices = [item["label"] for item in self.dropdown_metadata]
         self.option_name = option_name
@@ -113,14 +115,27 @@ class DropdownComponent(Component):
         self.sizer.Add(self.choice_box_sizer)
         self.sizer.AddSpacer(10)
 
-    def on_choice(self, event, is_propagating_up=True):
-        """ To enable nested dropdowns, every time a user selects a dropdown, we need to recalculate all other
-            dropdowns and associated options. Dropdowns affect other dropdowns.
+    def on_choice(self, event):
+        """ Dropdowns affect the dropdowns nested in them and the options of their parents. Every time a user selects
+            a dropdown, the whole tree is resolved once from the most parent dropdown.
+        """
+        self.get_root().resolve()
+
+        # Update the window
+        self.panel.request_layout()
 
-            is_propagating_up tells the dropdown to propagate the on_choice() command to the parent drop down until
-            there is no more parent. Moreover, on each call of on_choice(), the propagation will also go down. This
-            allows to recalculate each dropdown. There is some redundancy since we would really just want the most
-            parent dropdown to send the down propagation, but this will do for now.
+    def get_root(self):
+        """ Returns the most parent dropdown of the tree this dropdown belongs to"""
+        root = self
+        while root.dropdown_parent is not None:
+            root = root.dropdown_parent
+        return root
+
+    def resolve(self):
+        """ Show the sizers of the current selection and merge the options of its components, top-down.
+
+            The nested components are resolved before their options are merged, so that a single pass from the root
+            shows the right items and gathers the right options for the whole tree.
         """
         # Get the selection from the choice box widget
         if self.choice_box.GetSelection() < 0:
@@ -131,38 +146,25 @@ class DropdownComponent(Component):
 
         # Unshow everything then show the correct item according to the choice box
         self.unshow_choice_box_sizers()
+        index_dd = self.find_index(selection)
+        input_text_boxes = {}
         if selection in self.positions.keys():
             for a_index in self.positions[selection]:
                 sizer_item = self.sizer.GetItem(a_index)
                 sizer_item.Show(True)
-        else:
-            pass
 
-        index_dd = self.find_index(selection)
-        if selection in self.positions.keys():
-            # Add the sizers to the current list of options
             # find indexes of list_components that are associated with index dropdown
             indexes = [i for i, e in enumerate(self.component_to_dropdown_choice) if e == index_dd]
-            self.input_text_boxes = {}
             for index_comp in indexes:
                 component = self.list_components[index_comp]
+                # Showing a sizer shows everything in it, nested components hide what they don't need
+                component.resolve()
                 # Merge both input_text_boxes
-                self.input_text_boxes.update(component.input_text_boxes)
-                # Propagate down to show or hide the relevant sub DropdownComponents
-                if type(component) == DropdownComponent:
-                    component.on_choice(None, is_propagating_up=False)
+                input_text_boxes.update(component.input_text_boxes)
 
         # Add the dropdown to the list of options
-        self.input_text_boxes[self.option_name] = [self.dropdown_metadata[index_dd]["option_value"]]
-
-        # Update the parent if there is one (This allows to propagate nested dropdown selection)
-        if is_propagating_up:
-            if self.dropdown_parent is not None:
-                self.dropdown_parent.on_choice(None)
-
-        # Update the window
-        self.panel.SetVirtualSize(self.panel.sizer_run.GetMinSize())
-        self.panel.Layout()
+        input_text_boxes[self.option_name] = [self.dropdown_metadata[index_dd]["option_value"]]
+        self.input_text_boxes = input_text_boxes
 
     def find_index(self, label):
         for index in range(len(self.dropdown_metadata)):
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*
+
+"""Index of the help texts of the ``Shimming Toolbox`` CLI options
+
+The index maps each option name of a CLI to its help text. It is saved on disk along with the version of
+``shimmingtoolbox`` it was built from, so that building the tabs only does dictionary lookups and the CLI modules are
+only imported when the index is missing or ``shimmingtoolbox`` was upgraded.
+
+CLIs are referred to as ``"module:attribute"``, ex: ``"shimmingtoolbox.cli.b0shim:dynamic"``.
+"""
+
+import importlib
+import json
+import logging
+import os
+from importlib.metadata import PackageNotFoundError, version
+
+from fsleyes_plugin_shimming_toolbox import HOME_DIR
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = os.path.join(HOME_DIR, '.cache', 'fsleyes-plugin-shimming-toolbox', 'help_index.json')
+
+_index = None
+
+
+def get_st_version():
+    """Returns the installed version of ``shimmingtoolbox``, None if it is not installed."""
+    try:
+        return version('shimmingtoolbox')
+    except PackageNotFoundError:
+        return None
+
+
+def load_cli(cli_ref):
+    """Import a CLI from its ``"module:attribute"`` reference."""
+    module_name, attribute = cli_ref.split(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def index_cli(cli_function):
+    """Returns the help texts of a click command keyed by every name its options can be looked up with.
+
+    An option can be looked up by any of its flags without the dashes (``o`` or ``output`` for ``-o/--output``) or
+    by its name. If a name is shared, the first option of the command wins.
+    """
+    entries = {}
+    for param in cli_function.params:
+        # Positional arguments have no help text
+        help_text = getattr(param, 'help', None)
+        for opt in param.opts:
+            entries.setdefault(opt.lstrip('-'), help_text)
+        entries.setdefault(param.human_readable_name, help_text)
+    return entries
+
+
+class HelpIndex:
+    """Help texts of the CLIs keyed by CLI reference and option name, persisted in ``path``.
+
+    The tabs refer to their CLIs by reference rather than importing them, so a CLI module is only imported when its
+    help texts are not in the index yet.
+    """
+
+    def __init__(self, path=INDEX_PATH, st_version=None):
+        self.path = path
+        self.st_version = st_version if st_version is not None else get_st_version()
+        self.clis = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Help texts change between versions
+        if data.get('version') == self.st_version:
+            self.clis = data.get('clis', {})
+
+    def save(self):
+        if self.st_version is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            path_tmp = self.path + '.tmp'
+            with open(path_tmp, 'w') as f:
+                json.dump({'version': self.st_version, 'clis': self.clis}, f)
+            os.replace(path_tmp, self.path)
+        except OSError as err:
+            logger.info(f"Could not save the help index: {err}")
+
+    def get(self, cli_ref, name):
+        """Returns the help text of the option ``name`` of a CLI.
+
+        Raises:
+            ValueError: If the CLI has no such option.
+        """
+        if cli_ref not in self.clis:
+            self.clis[cli_ref] = index_cli(load_cli(cli_ref))
+            self.save()
+
+        entries = self.clis[cli_ref]
+        if name.lstrip('-') in entries:
+            return entries[name.lstrip('-')]
+        raise ValueError(f"Could not find param: {name} in {cli_ref}")
+
+
+def get_help_index():
+    """Returns the plugin-wide help index."""
+    global _index
+    if _index is None:
+        _index = HelpIndex()
+    return _index
@@ -1,19 +1,28 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*
 
-import fsleyes.actions.loadoverlay as loadoverlay
+import collections
+import functools
 import glob
-import imageio
-import nibabel as nib
 import numpy as np
 import os
+import threading
 import wx
 
-from fsleyes_plugin_shimming_toolbox import __DIR_ST_PLUGIN_IMG__
 from fsleyes_plugin_shimming_toolbox.components.component import Component, RunArgumentErrorST
 from fsleyes_plugin_shimming_toolbox.components.input_component import InputComponent
-from fsleyes_plugin_shimming_toolbox.events import EVT_RESULT, EVT_LOG
-from fsleyes_plugin_shimming_toolbox.worker_thread import WorkerThread
+from fsleyes_plugin_shimming_toolbox.events import get_dispatcher, STATUS_CANCELLED, STATUS_TIMED_OUT
+from fsleyes_plugin_shimming_toolbox.icons import get_bitmap
+from fsleyes_plugin_shimming_toolbox.overlay_loader import get_overlay_loader, read_nifti
+from fsleyes_plugin_shimming_toolbox.preflight import preflight
+from fsleyes_plugin_shimming_toolbox.result_cache import get_result_cache
+from fsleyes_plugin_shimming_toolbox.scheduler import get_scheduler, Job
+
+# A submitted job with the outputs of its run. ``cache_key`` is None if the result should not be cached, ``before`` is
+# the snapshot of the output folder taken before the job was submitted.
+RunningJob = collections.namedtuple('RunningJob', ['job', 'output', 'load_in_overlay', 'cache_key', 'before'])
+# Opt-in: set ST_PLUGIN_PERSIST_PNG=1 to also save the NIfTI conversion of the PNG outputs next to them
+PERSIST_PNG = os.environ.get('ST_PLUGIN_PERSIST_PNG', '0') == '1'
 
 
 class RunComponent(Component):
@@ -26,21 +35,21 @@ class RunComponent(Component):
         output_paths (list of str): file or folder paths containing output from ``st_function``.
         output_paths (list of str): relative path of files containing output from ``st_function``. Path is relative to
                                     the output option's folder.
+        jobs (dict): Queued or running ``RunningJob`` of this component keyed by job id.
     """
 
     def __init__(self, panel, st_function, list_components=[], output_paths=[]):
         super().__init__(panel, list_components)
         self.st_function = st_function
         self.sizer = self.create_sizer()
+        self.button_cancel = None
+        self.checkbox_bypass_cache = None
         self.add_button_run()
         self.output = ""
         self.output_paths_original = output_paths
         self.output_paths = output_paths.copy()
         self.load_in_overlay = []
-        self.worker = None
-
-        self.panel.Bind(EVT_RESULT, self.on_result)
-        self.panel.Bind(EVT_LOG, self.log)
+        self.jobs = {}
 
     def create_sizer(self):
         """Create the centre sizer containing tab-specific functionality."""
@@ -52,73 +61,52 @@ class RunComponent(Component):
         return sizer
 
     def add_button_run(self):
-        """Add the run button which will call the ``Shimming Toolbox`` CLI."""
+        """Add the run button which will call the ``Shimming Toolbox`` CLI and the button to cancel it."""
         button_run = wx.Button(self.panel, -1, label="Run", size=(85, 48))
         button_run.Bind(wx.EVT_BUTTON, self.button_run_on_click)
-        play_icon = wx.Bitmap(os.path.join(__DIR_ST_PLUGIN_IMG__, 'play.png'), wx.BITMAP_TYPE_PNG)
+        play_icon = get_bitmap('play.png')
         button_run.SetBitmap(play_icon, dir=wx.LEFT)
-        self.sizer.Add(button_run, 0, wx.CENTRE)
+
+        self.button_cancel = wx.Button(self.panel, -1, label="Cancel", size=(85, 48))
+        self.button_cancel.Bind(wx.EVT_BUTTON, self.button_cancel_on_click)
+        self.button_cancel.Disable()
+
+        self.checkbox_bypass_cache = wx.CheckBox(self.panel, -1, label="Bypass cache")
+        self.checkbox_bypass_cache.SetToolTip("Run the command even if the result of the same command on the same "
+                                              "inputs is cached. The new result replaces the cached one.")
+
+        sizer_buttons = wx.BoxSizer(wx.HORIZONTAL)
+        sizer_buttons.Add(button_run, 0, wx.RIGHT, 10)
+        sizer_buttons.Add(self.button_cancel, 0, wx.RIGHT, 10)
+        sizer_buttons.Add(self.checkbox_bypass_cache, 0, wx.ALIGN_CENTER_VERTICAL)
+        self.sizer.Add(sizer_buttons, 0, wx.CENTRE)
         self.sizer.AddSpacer(10)
 
     def log(self, event):
-        """Log to the terminal the when there is a log event"""
-
-        # Since the log events get broadcated to all the RunComponents of the Tab, we check that the event name
-        # corresponds to our function i.e self.st_function
-        if event.name == self.st_function:
-            msg = event.get_data()
-            self.panel.terminal_component.log_to_terminal(msg)
-        else:
-            event.Skip()
+        """Log to the terminal the when there is a log event of one of our jobs"""
+        msg = event.get_data()
+        self.panel.terminal_component.log_to_terminal(msg)
 
     def on_result(self, event):
-        # Since the log events get broadcated to all the RunComponents of the Tab, we check that the event name
-        # corresponds to our function i.e self.st_function
-        if event.name != self.st_function:
-            event.Skip()
+        """Called by the ``JobEventDispatcher`` when one of our jobs finished"""
+        if event.job_id not in self.jobs:
             return
+        running_job = self.jobs.pop(event.job_id)
 
         data = event.get_data()
+        status = event.get_status()
+        if status in [STATUS_CANCELLED, STATUS_TIMED_OUT]:
+            msg = f"Run {self.st_function} {status}\n"
+            self.panel.terminal_component.log_to_terminal(msg, level="WARNING")
+
         # Return code is 0 if everything ran smoothly
-        if data == 0:
+        elif data == 0:
             msg = f"Run {self.st_function} completed successfully\n"
             self.panel.terminal_component.log_to_terminal(msg, level="INFO")
 
-            # Get the directory of the output if it is a file or already a directory
-            if os.path.isfile(self.output):
-                folder = os.path.split(self.output)[0]
-            else:
-                folder = self.output
-
-            # Add the directory to the relative path of path output
-            for i_file in range(len(self.output_paths)):
-                self.output_paths[i_file] = os.path.join(folder, self.output_paths[i_file])
-
-            # Append the file if it was a file
-            if os.path.isfile(self.output):
-                self.output_paths.append(self.output)
-
-            # Append files that are a direct output from "load_in_overlay"
-            for fname in self.load_in_overlay:
-                self.output_paths.append(fname)
-
-            if self.st_function == "st_dicom_to_nifti":
-                # If its dicom_to_nifti, output all .nii found in the subject folder to the overlay
-                try:
-                    path_output, subject = self.fetch_paths_dicom_to_nifti()
-                    path_sub = os.path.join(path_output, 'sub-' + subject)
-                    list_files = sorted(glob.glob(os.path.join(path_sub, '*', '*.nii*')))
-                    for file in list_files:
-                        self.output_paths.append(file)
-
-                except Exception:
-                    self.panel.terminal_component.log_to_terminal(
-                        "Could not fetch subject and/or path to load to overlay"
-                    )
-            self.send_output_to_overlay()
-
-            self.output_paths.clear()
-            self.output_paths = self.output_paths_original.copy()
+            if running_job.cache_key is not None:
+                self.store_in_cache(running_job)
+            self.load_outputs(running_job.output, running_job.load_in_overlay)
 
         elif type(data) == Exception:
             msg = f"Run {self.st_function} errored out\n"
@@ -139,9 +127,83 @@ class RunComponent(Component):
             # The error message should already be displayed
             self.panel.terminal_component.log_to_terminal(str(data), level="ERROR")
 
-        self.worker = None
-        self.load_in_overlay = []
-        event.Skip()
+        resource_usage = event.get_resource_usage()
+        if resource_usage is not None:
+            self.panel.terminal_component.log_to_terminal(f"{self.st_function}: {resource_usage}", level="INFO")
+
+        if not self.jobs:
+            self.button_cancel.Disable()
+
+    def load_outputs(self, output, load_in_overlay):
+        """Load the outputs of a successful run as overlays."""
+        # Get the directory of the output if it is a file or already a directory
+        if os.path.isfile(output):
+            folder = os.path.split(output)[0]
+        else:
+            folder = output
+
+        # Add the directory to the relative path of path output
+        for i_file in range(len(self.output_paths)):
+            self.output_paths[i_file] = os.path.join(folder, self.output_paths[i_file])
+
+        # Append the file if it was a file
+        if os.path.isfile(output):
+            self.output_paths.append(output)
+
+        # Append files that are a direct output from "load_in_overlay"
+        for fname in load_in_overlay:
+            self.output_paths.append(fname)
+
+        if self.st_function == "st_dicom_to_nifti":
+            # If its dicom_to_nifti, output all .nii found in the subject folder to the overlay
+            try:
+                path_output, subject = self.fetch_paths_dicom_to_nifti()
+                path_sub = os.path.join(path_output, 'sub-' + subject)
+                list_files = sorted(glob.glob(os.path.join(path_sub, '*', '*.nii*')))
+                for file in list_files:
+                    self.output_paths.append(file)
+
+            except Exception:
+                self.panel.terminal_component.log_to_terminal(
+                    "Could not fetch subject and/or path to load to overlay"
+                )
+        self.send_output_to_overlay()
+
+        self.output_paths.clear()
+        self.output_paths = self.output_paths_original.copy()
+
+    def store_in_cache(self, running_job):
+        """Copy the files created or modified by the run to the result cache, in the background."""
+        threading.Thread(target=get_result_cache().store_changes,
+                         args=(running_job.cache_key, running_job.output, running_job.before,
+                               running_job.load_in_overlay),
+                         daemon=True).start()
+
+    def check_cache(self, command, msg, output, load_in_overlay):
+        """Called in a thread: hashing the inputs and restoring the outputs can take a while on large inputs."""
+        try:
+            cache_key, restored, before = get_result_cache().lookup(command, output, load_in_overlay)
+        except Exception as err:
+            # The cache must never prevent a run
+            cache_key, restored, before = None, None, {}
+            wx.CallAfter(self.log_if_alive, f"Could not check the result cache: {err}", "WARNING")
+        wx.CallAfter(self.on_cache_checked, command, msg, output, load_in_overlay, cache_key, restored, before)
+
+    def on_cache_checked(self, command, msg, output, load_in_overlay, cache_key, restored, before):
+        if not self.panel:
+            # The panel was closed while the inputs were hashed
+            return
+        if restored is not None:
+            self.panel.terminal_component.log_to_terminal(
+                f"Restored {len(restored)} output file(s) of {self.st_function} from the cache, check "
+                f"'Bypass cache' to run it again", level="INFO")
+            self.load_outputs(output, load_in_overlay)
+            return
+        self.submit(command, msg, output, load_in_overlay, cache_key, before)
+
+    def log_if_alive(self, msg, level):
+        if self.panel:
+            self.panel.terminal_component.log_to_terminal(msg, level=level)
 
     def button_run_on_click(self, event):
         """Function called when the ``Run`` button is clicked.
@@ -151,34 +213,59 @@ class RunComponent(Component):
         """
         self.run()
 
+    def button_cancel_on_click(self, event):
+        """Function called when the ``Cancel`` button is clicked. Stops the queued or running CLI."""
+        self.cancel()
+
+    def cancel(self):
+        """Cancel all the queued or running jobs of this component."""
+        for job in [running_job.job for running_job in self.jobs.values()]:
+            self.panel.terminal_component.log_to_terminal(f"Cancelling {self.st_function}", level="INFO")
+            get_scheduler().cancel(job)
+
     def run(self):
-        if not self.worker:
-            try:
-                command, msg = self.get_run_args(self.st_function)
-            except RunArgumentErrorST as err:
-                self.panel.terminal_component.log_to_terminal(err, level="ERROR")
-                return
+        self.output = ""
+        self.load_in_overlay = []
+        try:
+            command, msg = self.get_run_args(self.st_function)
+            # Refuse to start a command that would fail on its inputs
+            preflight(self.st_function, command)
+        except RunArgumentErrorST as err:
+            self.panel.terminal_component.log_to_terminal(err, level="ERROR")
+            return
 
-            self.panel.terminal_component.log_to_terminal(msg, level="INFO")
-            self.worker = WorkerThread(self.panel, command, name=self.st_function)
+        output, load_in_overlay = self.output, self.load_in_overlay
+        self.load_in_overlay = []
+
+        if output and not self.checkbox_bypass_cache.GetValue():
+            threading.Thread(target=self.check_cache, args=(command, msg, output, load_in_overlay),
+                             daemon=True).start()
+        else:
+            self.submit(command, msg, output, load_in_overlay)
+
+    def submit(self, command, msg, output, load_in_overlay, cache_key=None, before=None):
+        """Submit the command to the scheduler. Its result is stored under ``cache_key`` if it is not None."""
+        self.panel.terminal_component.log_to_terminal(msg, level="INFO")
+        scheduler = get_scheduler()
+        job = Job(command, self.st_function)
+        # Keep the outputs of this run with the job, the inputs can change before it finishes
+        self.jobs[job.id] = RunningJob(job, output, load_in_overlay, cache_key, before)
+        get_dispatcher().register(job.id, self)
+        self.button_cancel.Enable()
+        if not scheduler.submit(job):
+            self.panel.terminal_component.log_to_terminal(
+                f"{self.st_function} is queued ({scheduler.status_message()})", level="INFO")
 
     def send_output_to_overlay(self):
+        """Load the output files as overlays in the background, the GUI stays responsive while they are read."""
+        overlays = []
         for output_path in self.output_paths:
             if os.path.isfile(output_path):
-                try:
-                    # Display the overlay
-                    window = self.panel.GetGrandParent()
-                    if output_path[-4:] == ".png":
-                        load_png_image_from_path(window, output_path, colormap="greyscale")
-                    elif output_path[-7:] == ".nii.gz" or output_path[-4:] == ".nii":
-                        # Load the NIfTI image as an overlay
-                        img_overlay = loadoverlay.loadOverlays(
-                            paths=[output_path],
-                            inmem=True,
-                            blocking=True)[0]
-                        window.overlayList.append(img_overlay)
-                except Exception as err:
-                    self.panel.terminal_component.log_to_terminal(str(err), level="ERROR")
+                if output_path[-4:] == ".png":
+                    overlays.append((output_path, functools.partial(png_to_image, persist=PERSIST_PNG), "greyscale"))
+                elif output_path[-7:] == ".nii.gz" or output_path[-4:] == ".nii":
+                    overlays.append((output_path, read_nifti, None))
+        get_overlay_loader().load(self.panel.GetGrandParent(), overlays, self.panel.terminal_component)
 
     def get_run_args(self, st_function):
         """The option are a list of tuples where the tuple: (name, [value1, value2])"""
@@ -220,7 +307,8 @@ class RunComponent(Component):
             return path_output, subject
 
 
-def load_png_image_from_path(fsl_panel, image_path, is_mask=False, add_to_overlayList=True, colormap="greyscale"):
+def load_png_image_from_path(fsl_panel, image_path, is_mask=False, add_to_overlayList=True, colormap="greyscale",
+                             persist=False):
     """Convert a 2D image into a NIfTI image and load it as an overlay.
 
     The parameter ``add_to_overlayList`` enables displaying the overlay in FSLeyes.
@@ -234,10 +322,37 @@ def load_png_image_from_path(fsl_panel, image_path, is_mask=False, add_to_overla
             True by default.
         colormap (str): (optional) the colormap of image that will be displayed. This parameter
             is set to greyscale by default.
+        persist (bool): (optional) Whether or not to save the NIfTI image next to the 2D image.
+            This parameter is False by default, the image only lives in memory.
 
     Returns:
         overlay: the FSLeyes overlay corresponding to the loaded image.
     """
+    img_overlay = png_to_image(image_path, is_mask=is_mask, persist=persist)
+
+    # Display the overlay
+    if add_to_overlayList is True:
+        fsl_panel.overlayList.append(img_overlay)
+        opts = fsl_panel.displayCtx.getOpts(img_overlay)
+        opts.cmap = colormap
+
+    return img_overlay
+
+
+def png_to_image(image_path, is_mask=False, persist=False):
+    """Convert a 2D image into a NIfTI image in memory. Does not use the GUI, it can be called from the overlay
+    loader's worker.
+
+    Args:
+        image_path (str): The location of the image, including the name and the .extension
+        is_mask (bool): Whether or not this is a segmentation mask.
+        persist (bool): Save the NIfTI image next to the 2D image, with the .nii.gz extension.
+
+    Returns:
+        fsl.data.image.Image: The NIfTI image
+    """
+    # Imported here so that loading the plugin does not import nibabel
+    import fsl.data.image as fslimage
 
     # Open the 2D image
     img_png2d = read_image(image_path)
@@ -251,41 +366,42 @@ def load_png_image_from_path(fsl_panel, image_path, is_mask=False, add_to_overla
     # Convert image data into a NIfTI image
     # Note: PIL and NiBabel use different axis conventions, so some array manipulation has to be done.
     # TODO: save in the FOV of the current overlay
-    nii_img = nib.Nifti1Image(
-        np.rot90(img_png2d, k=1, axes=(1, 0)), np.eye(4)
-    )
-
-    # Save the NIfTI image in a temporary directory
-    fname_out = image_path[:-3] + "nii.gz"
-    nib.save(nii_img, fname_out)
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    img = fslimage.Image(np.rot90(img_png2d, k=1, axes=(1, 0)), xform=np.eye(4), name=name)
 
-    # Load the NIfTI image as an overlay
-    img_overlay = loadoverlay.loadOverlays(paths=[fname_out], inmem=True, blocking=True)[0]
-
-    # Display the overlay
-    if add_to_overlayList is True:
-        fsl_panel.overlayList.append(img_overlay)
-        opts = fsl_panel.displayCtx.getOpts(img_overlay)
-        opts.cmap = colormap
+    if persist:
+        img.save(os.path.splitext(image_path)[0] + ".nii.gz")
 
-    return img_overlay
+    return img
 
 
 def read_image(filename, bitdepth=8):
-    """Read image and convert it to desired bitdepth without truncation."""
+    """Read image and convert it to desired bitdepth without truncation.
+
+    The image is decoded once, colour images are converted to gray with the same luma weights as ``as_gray``.
+    """
+    import imageio
     if 'tif' in str(filename):
         raw_img = imageio.imread(filename, format='tiff-pil')
-        if len(raw_img.shape) > 2:
-            raw_img = imageio.imread(filename, format='tiff-pil', as_gray=True)
     else:
         raw_img = imageio.imread(filename)
-        if len(raw_img.shape) > 2:
-            raw_img = imageio.imread(filename, as_gray=True)
+
+    if len(raw_img.shape) > 2:
+        raw_img = to_gray(raw_img)
 
     img = imageio.core.image_as_uint(raw_img, bitdepth=bitdepth)
     return img
 
 
+def to_gray(img):
+    """Convert a colour image (L, LA, RGB or RGBA) to a gray float image, the alpha channel is ignored."""
+    if img.shape[-1] < 3:
+        return img[..., 0].astype(np.float64)
+    # ITU-R 601-2 luma, used by PIL to convert to gray
+    return img[..., :3].astype(np.float64) @ np.array([0.299, 0.587, 0.114])
+
+
 def write_image(filename, img, format='png'):
     """Write image."""
+    import imageio
     imageio.imwrite(filename, img, format=format)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from threading import Thread
+import wx
+
+from fsleyes_plugin_shimming_toolbox import __ST_DIR__
+from fsleyes_plugin_shimming_toolbox.events import get_dispatcher, result_event_type, ResultEvent
+from fsleyes_plugin_shimming_toolbox.events import log_event_type, LogEvent
+from fsleyes_plugin_shimming_toolbox.events import STATUS_CANCELLED, STATUS_TIMED_OUT
+from fsleyes_plugin_shimming_toolbox.warm_worker import get_warm_worker, WarmWorkerError
+
+PATH_ST_VENV = os.path.join(__ST_DIR__, 'python', 'bin')
+# Longest line of output read from a CLI
+STREAM_LIMIT = 2 ** 20
+# Seconds between SIGTERM and SIGKILL when a job is cancelled
+KILL_GRACE = 5
+# Seconds between two checks of whether a child exited once its output is closed
+REAP_INTERVAL = 0.05
+# Seconds between two deliveries of the buffered output lines to the GUI (25 Hz)
+LOG_FLUSH_INTERVAL = 0.04
+# Variables that limit the size of the BLAS/OpenMP thread pools of numpy/scipy
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS']
+
+_engine = None
+
+
+def get_st_env():
+    """Returns the environment used to call the ``shimming-toolbox`` CLIs."""
+    env = os.environ.copy()
+    # It seems to default to the Python executable instead of the Shebang, removing it fixes it
+    env["PYTHONEXECUTABLE"] = ""
+    env["PATH"] = PATH_ST_VENV + ":" + env["PATH"]
+    return env
+
+
+def get_job_env(job):
+    """Returns the environment of a job, its thread pools are limited to the cores allocated by the scheduler."""
+    env = get_st_env()
+    for var in THREAD_ENV_VARS:
+        env[var] = str(job.cores)
+    return env
+
+
+def describe_thread_policy(job):
+    msg = f"{job.name} uses {job.cores} thread(s)"
+    if job.cpus and hasattr(os, 'sched_setaffinity'):
+        msg += f" pinned to CPU(s) {format_cpus(job.cpus)}"
+    return msg
+
+
+def format_cpus(cpus):
+    """Format a list of CPU ids as ranges, ex: ``0-3,6``."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+def set_affinity(pid, cpus):
+    """Pin a process to ``cpus``, the threads and processes it creates afterwards inherit it. Linux only."""
+    if not cpus or not hasattr(os, 'sched_setaffinity'):
+        return
+    try:
+        os.sched_setaffinity(pid, cpus)
+    except OSError:
+        # The process already exited
+        pass
+
+
+class ResourceUsage:
+    """Resources used by a job.
+
+    Attributes:
+        wall_time (float): Elapsed time in seconds.
+        user_time (float): CPU time spent in user mode in seconds, includes the programs called by the CLI.
+        system_time (float): CPU time spent in the kernel in seconds, includes the programs called by the CLI.
+        max_rss (int): Peak resident memory in bytes.
+    """
+
+    def __init__(self, wall_time, user_time, system_time, max_rss):
+        self.wall_time = wall_time
+        self.user_time = user_time
+        self.system_time = system_time
+        self.max_rss = max_rss
+
+    @classmethod
+    def from_rusage(cls, wall_time, rusage):
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        max_rss = rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+        return cls(wall_time, rusage.ru_utime, rusage.ru_stime, max_rss)
+
+    def to_dict(self):
+        return {'wall_time': self.wall_time, 'user_time': self.user_time, 'system_time': self.system_time,
+                'max_rss': self.max_rss}
+
+    def __str__(self):
+        return f"wall time {self.wall_time:.1f} s, CPU time {self.user_time:.1f} s user + " \
+               f"{self.system_time:.1f} s system, peak memory {self.max_rss / 1024 ** 2:.1f} MB"
+
+
+class SubprocessEngine:
+    """Runs the CLIs of every job on a single background asyncio event loop.
+
+    The pipes of all the child processes are read by the same loop, so the number of threads does not depend on the
+    number of jobs in flight. Output and return codes are posted to the ``JobEventDispatcher`` as ``LogEvent`` and
+    ``ResultEvent`` tagged with the job id. Output lines are buffered and posted in batches every
+    ``LOG_FLUSH_INTERVAL`` seconds, one ``LogEvent`` per job and batch, so that verbose CLIs do not flood the GUI.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        # Lines not yet posted, keyed by job. Only used from the loop thread.
+        self.pending_logs = {}
+        self.flush_handle = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.run_loop, name="st_engine", daemon=True)
+        self.thread.start()
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, job, callback=None):
+        """Run ``job`` on the event loop. Can be called from any thread.
+
+        Args:
+            job (Job): Job to run.
+            callback (function): Called without arguments on the loop thread once the result has been posted.
+
+        Returns:
+            concurrent.futures.Future: Completes when the job is done.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.run_job(job, callback), self.loop)
+
+    def cancel(self, job, status=STATUS_CANCELLED):
+        """Terminate the process group of a running job. Can be called from any thread."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.terminate, job, status)
+
+    def terminate(self, job, status):
+        if job.cancel_status is not None or job.status != 'running':
+            return
+        job.cancel_status = status
+        # If the process is not started yet, it is killed as soon as its pid is known
+        if job.pid is not None:
+            self.kill_group(job)
+
+    def kill_group(self, job):
+        """Send SIGTERM to the job's process group (the CLI and the programs it called), then SIGKILL if it is
+        still running after ``KILL_GRACE`` seconds.
+        """
+        signal_group(job.pid, signal.SIGTERM)
+        self.loop.call_later(KILL_GRACE, self.kill_group_now, job)
+
+    def kill_group_now(self, job):
+        if job.status == 'running':
+            signal_group(job.pid, signal.SIGKILL)
+
+    def log(self, job, msg):
+        """Buffer a line of output of ``job``, it is posted with the next flush."""
+        self.pending_logs.setdefault(job, []).append(msg)
+        if self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(LOG_FLUSH_INTERVAL, self.flush_logs)
+
+    def flush_logs(self):
+        self.flush_handle = None
+        for job in list(self.pending_logs):
+            self.flush_job_logs(job)
+
+    def flush_job_logs(self, job):
+        lines = self.pending_logs.pop(job, None)
+        if lines:
+            post_log(job, '\n'.join(lines))
+
+    def set_pid(self, job, pid):
+        job.pid = pid
+        if job.cancel_status is not None:
+            self.kill_group(job)
+
+    async def run_job(self, job, callback=None):
+        timer = None
+        if job.timeout:
+            timer = self.loop.call_later(job.timeout, self.terminate, job, STATUS_TIMED_OUT)
+        try:
+            env = get_job_env(job)
+
+            rc = None
+            warm_worker = get_warm_worker()
+            if warm_worker is not None and warm_worker.is_ready():
+                try:
+                    rc = await self.run_warm(job, warm_worker, env)
+                except WarmWorkerError:
+                    # The job did not start on the worker, run it in a new process instead
+                    rc = None
+
+            if rc is None:
+                rc = await self.run_subprocess(job, env)
+            job.returncode = rc
+
+            # The output must be displayed before the result
+            self.flush_job_logs(job)
+            evt = ResultEvent(result_event_type, -1, job.name, job_id=job.id)
+            evt.set_data(rc)
+            evt.set_status(job.cancel_status)
+            evt.set_resource_usage(job.resource_usage)
+            wx.PostEvent(get_dispatcher(), evt)
+
+        except Exception as err:
+            # Send the error if there was one
+            self.flush_job_logs(job)
+            evt = ResultEvent(result_event_type, -1, job.name, job_id=job.id)
+            evt.set_data(err)
+            wx.PostEvent(get_dispatcher(), evt)
+
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if callback is not None:
+                callback()
+
+    async def run_subprocess(self, job, env):
+        # The warm worker logs the limits it could apply itself
+        self.log(job, describe_thread_policy(job))
+        # The process is reaped with os.wait4 to get its resource usage, asyncio's child watchers don't report it.
+        # Popen only forks and execs, it does not block.
+        start = time.monotonic()
+        process = subprocess.Popen(job.cmd,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   env=env,
+                                   start_new_session=True)
+        # The child leads a new process group which also holds the programs it calls (dcm2niix, prelude...)
+        self.set_pid(job, process.pid)
+        # Pin the CLI before it imports numpy and starts its thread pools
+        set_affinity(process.pid, job.cpus)
+
+        reader = asyncio.StreamReader(limit=STREAM_LIMIT, loop=self.loop)
+        transport, _ = await self.loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), process.stdout)
+        try:
+            async for line in reader:
+                output = line.decode(errors='replace').strip()
+                if output:
+                    self.log(job, output)
+        finally:
+            transport.close()
+
+        rc, rusage = await self.wait_for_exit(process.pid)
+        # Let Popen know that the process was reaped
+        process.returncode = rc
+        job.resource_usage = ResourceUsage.from_rusage(time.monotonic() - start, rusage)
+        return rc
+
+    async def wait_for_exit(self, pid):
+        """Reap a child process without blocking the loop.
+
+        Returns:
+            tuple: Return code (negative signal number if it was killed) and resource usage of the process.
+        """
+        while True:
+            wpid, status, rusage = os.wait4(pid, os.WNOHANG)
+            if wpid == pid:
+                return os.waitstatus_to_exitcode(status), rusage
+            await asyncio.sleep(REAP_INTERVAL)
+
+    async def run_warm(self, job, warm_worker, env):
+        """Run the job on the warm worker, the CLIs are already imported there."""
+        rc = None
+        start = time.monotonic()
+        async for message in warm_worker.run(job.cmd, env=env, cores=job.cores, cpus=job.cpus):
+            if 'log' in message:
+                if message['log'].strip():
+                    self.log(job, message['log'].strip())
+            elif 'pid' in message:
+                # The worker starts each job in a new process group
+                self.set_pid(job, message['pid'])
+            elif 'rc' in message:
+                rc = message['rc']
+                usage = message.get('rusage')
+                if usage is not None:
+                    job.resource_usage = ResourceUsage(time.monotonic() - start, usage['user_time'],
+                                                       usage['system_time'], usage['max_rss'])
+        return rc
+
+
+def post_log(job, msg):
+    evt = LogEvent(log_event_type, -1, job.name, job_id=job.id)
+    evt.set_data(msg)
+    wx.PostEvent(get_dispatcher(), evt)
+
+
+def signal_group(pgid, sig):
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        # The process group already exited
+        pass
+
+
+def get_engine():
+    """Returns the plugin-wide subprocess engine."""
+    global _engine
+    if _engine is None:
+        _engine = SubprocessEngine()
+    return _engine
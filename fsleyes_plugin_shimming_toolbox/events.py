@@ -9,12 +9,22 @@ EVT_RESULT = wx.PyEventBinder(result_event_type, 1)
 log_event_type = wx.NewEventType()
 EVT_LOG = wx.PyEventBinder(log_event_type, 1)
 
+# Status of a ResultEvent when the job was stopped before it finished
+STATUS_CANCELLED = "cancelled"
+STATUS_TIMED_OUT = "timed out"
+
+
+_dispatcher = None
+
 
 class ResultEvent(wx.PyCommandEvent):
-    def __init__(self, evtType, id, name):
+    def __init__(self, evtType, id, name, job_id=None):
         wx.PyCommandEvent.__init__(self, evtType, id)
         self.data = ""
         self.name = name
+        self.job_id = job_id
+        self.status = None
+        self.resource_usage = None
 
     def set_data(self, data):
         self.data = data
@@ -22,15 +32,68 @@ class ResultEvent(wx.PyCommandEvent):
     def get_data(self):
         return self.data
 
+    def set_status(self, status):
+        self.status = status
+
+    def get_status(self):
+        return self.status
+
+    def set_resource_usage(self, resource_usage):
+        self.resource_usage = resource_usage
+
+    def get_resource_usage(self):
+        return self.resource_usage
+
 
 class LogEvent(wx.PyCommandEvent):
-    def __init__(self, evtType, id, name):
+    def __init__(self, evtType, id, name, job_id=None):
         wx.PyCommandEvent.__init__(self, evtType, id)
         self.data = ""
         self.name = name
+        self.job_id = job_id
 
     def set_data(self, data):
         self.data = data
 
     def get_data(self):
-        return self.data
\ No newline at end of file
+        return self.data
+
+
+class JobEventDispatcher(wx.EvtHandler):
+    """Routes the log and result events of a job to the component that submitted it.
+
+    Components register the id of their job before submitting it. Events posted to the dispatcher from any thread are
+    then delivered on the GUI thread to that component only: ``log(event)`` for each ``LogEvent`` and
+    ``on_result(event)`` for the ``ResultEvent``, after which the job is unregistered.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.handlers = {}
+        self.Bind(EVT_LOG, self.on_log)
+        self.Bind(EVT_RESULT, self.on_result)
+
+    def register(self, job_id, component):
+        self.handlers[job_id] = component
+
+    def unregister(self, job_id):
+        self.handlers.pop(job_id, None)
+
+    def on_log(self, event):
+        component = self.handlers.get(event.job_id)
+        # The panel of the component can be closed while its job is running
+        if component is not None and component.panel:
+            component.log(event)
+
+    def on_result(self, event):
+        component = self.handlers.pop(event.job_id, None)
+        if component is not None and component.panel:
+            component.on_result(event)
+
+
+def get_dispatcher():
+    """Returns the plugin-wide event dispatcher, it must first be called from the GUI thread."""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = JobEventDispatcher()
+    return _dispatcher
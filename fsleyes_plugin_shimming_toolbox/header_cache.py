@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*
+
+"""Cache of the headers of the NIfTI files used as inputs
+
+Only the header and the JSON sidecar are read, the voxel data stays on disk behind nibabel's array proxy. Entries are
+keyed on the absolute path of the file and are read again if its size or modification time changed.
+"""
+
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+NIFTI_EXTENSIONS = ('.nii', '.nii.gz')
+
+_cache = None
+
+
+def is_nifti(path):
+    return path.endswith(NIFTI_EXTENSIONS)
+
+
+def get_sidecar_path(path):
+    """Returns the path of the JSON sidecar of a NIfTI file."""
+    for ext in NIFTI_EXTENSIONS[::-1]:
+        if path.endswith(ext):
+            return path[:-len(ext)] + '.json'
+    return os.path.splitext(path)[0] + '.json'
+
+
+class HeaderInfo:
+    """Header of a NIfTI file.
+
+    Attributes:
+        path (str): Absolute path of the file.
+        shape (tuple): Shape of the image.
+        affine (numpy.ndarray): 4x4 affine of the image.
+        dtype (numpy.dtype): Data type of the voxels on disk.
+        memory_dtype (numpy.dtype): Data type of the voxels once read, scaled voxels are read as floats.
+        zooms (tuple): Voxel size and repetition time.
+        sidecar (dict): Content of the JSON sidecar, empty if there is none.
+        stat (tuple): Size and modification time of the file when it was read.
+    """
+
+    def __init__(self, path, shape, affine, dtype, memory_dtype, zooms, sidecar, stat):
+        self.path = path
+        self.shape = shape
+        self.affine = affine
+        self.dtype = dtype
+        self.memory_dtype = memory_dtype
+        self.zooms = zooms
+        self.sidecar = sidecar
+        self.stat = stat
+
+    @classmethod
+    def read(cls, path, stat):
+        # Imported here so that loading the plugin does not import nibabel
+        import nibabel as nib
+        import numpy as np
+
+        # Loading with nibabel only parses the header, the data is read when it is accessed
+        nii = nib.load(path)
+        # nibabel applies the scaling of the header when the data is read
+        slope, inter = getattr(nii.dataobj, 'slope', 1.0), getattr(nii.dataobj, 'inter', 0.0)
+        memory_dtype = nii.get_data_dtype()
+        if slope != 1 or inter != 0:
+            memory_dtype = np.result_type(memory_dtype, np.asanyarray(slope), np.asanyarray(inter))
+        sidecar = {}
+        fname_json = get_sidecar_path(path)
+        if os.path.isfile(fname_json):
+            try:
+                with open(fname_json) as f:
+                    sidecar = json.load(f)
+            except (OSError, ValueError) as err:
+                logger.info(f"Could not read {fname_json}: {err}")
+        return cls(path, nii.shape, nii.affine, nii.get_data_dtype(), memory_dtype, nii.header.get_zooms(), sidecar,
+                   stat)
+
+
+class HeaderCache:
+    """Plugin-wide cache of ``HeaderInfo``, entries are read again when the size or mtime of their file changes."""
+
+    def __init__(self):
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get(self, path):
+        """Returns the ``HeaderInfo`` of a NIfTI file, reading its header if it is not cached or out of date.
+
+        Returns:
+            HeaderInfo: Header of the file, None if it is not a readable NIfTI file.
+        """
+        path = os.path.abspath(path)
+        if not is_nifti(path):
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stat = (st.st_size, st.st_mtime_ns)
+
+        with self._lock:
+            entry = self.entries.get(path)
+        if entry is not None and entry.stat == stat:
+            return entry
+
+        try:
+            entry = HeaderInfo.read(path, stat)
+        except Exception as err:
+            logger.info(f"Could not read the header of {path}: {err}")
+            return None
+        with self._lock:
+            self.entries[path] = entry
+        return entry
+
+    def prefetch(self, path):
+        """Read the header of ``path`` in the background if it is an existing NIfTI file."""
+        if not is_nifti(path) or not os.path.isfile(path):
+            return
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="st_headers")
+        self._executor.submit(self.get, path)
+
+    def invalidate(self, path):
+        with self._lock:
+            self.entries.pop(os.path.abspath(path), None)
+
+
+def get_header_cache():
+    """Returns the plugin-wide header cache."""
+    global _cache
+    if _cache is None:
+        _cache = HeaderCache()
+    return _cache
@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*
+
+import os
+import wx
+
+from fsleyes_plugin_shimming_toolbox import __DIR_ST_PLUGIN_IMG__
+
+# Decoded bitmaps keyed by (file name, scale), shared by all the widgets of the plugin
+_bitmaps = {}
+
+
+def get_bitmap(fname, scale=None):
+    """Returns the bitmap of an image of the ``img`` folder, it is only decoded the first time it is requested.
+
+    Args:
+        fname (str): Name of the PNG file in the ``img`` folder.
+        scale (float): (optional) Factor by which the image is rescaled.
+
+    Returns:
+        wx.Bitmap: Bitmap of the image, it must not be modified.
+    """
+    key = (fname, scale)
+    if key not in _bitmaps:
+        image = wx.Image(os.path.join(__DIR_ST_PLUGIN_IMG__, fname), wx.BITMAP_TYPE_PNG)
+        if scale is not None:
+            image.Rescale(int(image.GetWidth() * scale), int(image.GetHeight() * scale), wx.IMAGE_QUALITY_HIGH)
+        _bitmaps[key] = image.ConvertToBitmap()
+    return _bitmaps[key]
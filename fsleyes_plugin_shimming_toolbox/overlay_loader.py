@@ -0,0 +1,357 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*
+
+"""Load the outputs of the runs as overlays without blocking the GUI
+
+The files are read one by one by a background worker. Each image is appended to the overlay list on the GUI thread as
+soon as it is read, in the order the files were given, so the first outputs can be looked at while the next ones are
+decompressed. An output that is already displayed, because the same command was run again, replaces its overlay and
+keeps its display settings instead of being added a second time.
+
+Outputs whose voxel data is larger than ``INMEM_MAX_MB`` are not read in memory. Their data is memory-mapped, from an
+uncompressed copy in ``UNCOMPRESSED_DIR`` if the file is gzipped, so that only what is displayed stays resident. When
+the outputs in memory exceed ``OVERLAY_BUDGET_MB``, the least recently selected ones are memory-mapped as well.
+The uncompressed copies are kept to be reused, the least recently used ones are removed beyond
+``UNCOMPRESSED_SIZE_MB``.
+"""
+
+import concurrent.futures
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import time
+import types
+import weakref
+
+import numpy as np
+import wx
+
+from fsleyes_plugin_shimming_toolbox import HOME_DIR
+from fsleyes_plugin_shimming_toolbox.header_cache import get_header_cache, is_nifti
+
+logger = logging.getLogger(__name__)
+
+# Outputs with more voxel data are memory-mapped instead of read in memory, a negative value reads everything in memory
+INMEM_MAX_MB = float(os.environ.get('ST_PLUGIN_INMEM_MAX_MB', 256))
+UNCOMPRESSED_DIR = os.environ.get('ST_PLUGIN_UNCOMPRESSED_DIR',
+                                  os.path.join(HOME_DIR, '.cache', 'fsleyes-plugin-shimming-toolbox', 'uncompressed'))
+# Maximum size of the uncompressed copies on disk
+UNCOMPRESSED_SIZE_MB = float(os.environ.get('ST_PLUGIN_UNCOMPRESSED_SIZE_MB', 4096))
+# Memory the data of the overlays loaded by the plugin can take, a negative value disables the budget
+OVERLAY_BUDGET_MB = float(os.environ.get('ST_PLUGIN_OVERLAY_BUDGET_MB', 2048))
+CHUNK_SIZE = 2 ** 20
+
+_loader = None
+# Images read_nifti memory-mapped, their data is only counted in the memory budget once it is read in memory
+_mapped = weakref.WeakSet()
+
+
+def get_data_size(path):
+    """Returns the size in bytes of the voxel data of a NIfTI file once read, the size of the file if its header can't
+    be read."""
+    header = get_header_cache().get(path)
+    if header is None:
+        return os.path.getsize(path)
+    return int(np.prod(header.shape)) * header.memory_dtype.itemsize
+
+
+def uncompress(path, folder=None, max_bytes=None):
+    """Returns an uncompressed copy of a ``.nii.gz`` file.
+
+    The copy is reused as long as the file does not change, only the copy of its latest version is kept. When the
+    copies in ``folder`` (default: ``UNCOMPRESSED_DIR``) take more than ``max_bytes`` (default:
+    ``UNCOMPRESSED_SIZE_MB``), the least recently used ones are removed. Copies an image still maps are kept until it
+    is closed.
+    """
+    if folder is None:
+        folder = UNCOMPRESSED_DIR
+    if max_bytes is None:
+        max_bytes = int(UNCOMPRESSED_SIZE_MB * 2 ** 20)
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    prefix = hashlib.sha1(path.encode()).hexdigest()
+    fname = os.path.join(folder, f"{prefix}_{st.st_size}_{st.st_mtime_ns}.nii")
+    if os.path.isfile(fname):
+        # The modification time of a copy is when it was last used
+        os.utime(fname)
+        return fname
+
+    os.makedirs(folder, exist_ok=True)
+    in_use = get_mapped_files()
+    for fname_old in glob.glob(os.path.join(folder, prefix + '_*.nii')):
+        if os.path.realpath(fname_old) in in_use:
+            continue
+        try:
+            os.remove(fname_old)
+        except OSError:
+            pass
+    fname_tmp = f"{fname}.{os.getpid()}.tmp"
+    with gzip.open(path, 'rb') as f_in, open(fname_tmp, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out, CHUNK_SIZE)
+    os.replace(fname_tmp, fname)
+    evict_uncompressed(folder, max_bytes, keep=fname)
+    return fname
+
+
+def evict_uncompressed(folder, max_bytes, keep=None):
+    """Remove the least recently used uncompressed copies of ``folder`` until they fit in ``max_bytes``.
+
+    ``keep`` and the copies an image still maps are not removed, nibabel opens the file again each time the data of a
+    memory-mapped image is read.
+    """
+    in_use = get_mapped_files()
+    copies = []
+    for fname in glob.glob(os.path.join(folder, '*.nii')):
+        try:
+            st = os.stat(fname)
+        except OSError:
+            continue
+        copies.append((st.st_mtime, st.st_size, fname))
+    total = sum(size for _, size, _ in copies)
+    for _, size, fname in sorted(copies):
+        if total <= max_bytes:
+            break
+        if fname == keep or os.path.realpath(fname) in in_use:
+            continue
+        try:
+            os.remove(fname)
+        except OSError:
+            continue
+        total -= size
+
+
+def get_mapped_files():
+    """Returns the real paths of the files the memory-mapped images that are still alive read their data from."""
+    # fslpy resolves the symbolic links of the data source
+    return {os.path.realpath(image.dataSource) for image in list(_mapped) if image.dataSource is not None}
+
+
+def read_nifti(path, inmem_max_mb=None):
+    """Read a NIfTI file.
+
+    Files with up to ``inmem_max_mb`` (default: ``INMEM_MAX_MB``) of voxel data are read in memory. The data of larger
+    files is memory-mapped and only read when it is accessed, gzipped files are uncompressed first.
+    """
+    # Imported here so that loading the plugin does not import nibabel
+    import fsl.data.image as fslimage
+
+    if inmem_max_mb is None:
+        inmem_max_mb = INMEM_MAX_MB
+    if inmem_max_mb < 0 or get_data_size(path) <= inmem_max_mb * 2 ** 20:
+        image = fslimage.Image(path, loadMeta=True)
+        # Decode the data here, in the worker, rather than on the GUI thread when the overlay is first drawn
+        image.data
+        return image
+
+    name = fslimage.removeExt(os.path.basename(path))
+    path_data = uncompress(path) if path.endswith('.gz') else path
+    # The data is not accessed, nibabel memory-maps uncompressed files and only what is displayed is read
+    image = fslimage.Image(path_data, name=name)
+    # The JSON sidecar is next to the output, not next to its uncompressed copy
+    image.updateMeta(fslimage.loadMetadata(types.SimpleNamespace(dataSource=path)))
+    _mapped.add(image)
+    return image
+
+
+class LoadedOverlay:
+    """Overlay loaded by the plugin.
+
+    Attributes:
+        source (str): Absolute path of the file the overlay was read from. It is not always its data source, which can
+                      be an uncompressed copy or the NIfTI conversion of a PNG.
+        nbytes (int): Size of the data of the overlay in memory, 0 if it is memory-mapped.
+        last_selected (float): ``time.monotonic()`` when the overlay was last selected, or loaded.
+        released (bool): The overlay is being replaced by a memory-mapped one to stay within the budget.
+    """
+
+    def __init__(self, source, nbytes, last_selected):
+        self.source = source
+        self.nbytes = nbytes
+        self.last_selected = last_selected
+        self.released = False
+
+
+class OverlayLoader:
+    """Plugin-wide loader of overlays, files are read by a single background worker.
+
+    The overlays loaded by the plugin are tracked in ``entries``. When their data in memory exceeds ``budget_mb``, the
+    least recently selected ones are memory-mapped from their file, or unloaded if it no longer exists. Overlays
+    opened by the user are never touched.
+    """
+
+    def __init__(self, budget_mb=OVERLAY_BUDGET_MB):
+        self._executor = None
+        self.budget_mb = budget_mb
+        self.entries = weakref.WeakKeyDictionary()
+        self._watched = weakref.WeakSet()
+
+    def load(self, window, overlays, terminal):
+        """Read ``overlays`` in the background and append them to the overlay list of ``window`` as they are ready.
+
+        Args:
+            window (fsleyes.frame.FSLeyesFrame): Frame whose overlay list the images are appended to.
+            overlays (list): Tuples ``(path, read, colormap)``. ``read(path)`` is called in the worker and returns the
+                             ``fsl.data.image.Image`` to display, ``colormap`` is None to keep the default one.
+            terminal (Terminal): Terminal the progress is logged to.
+        """
+        if not overlays:
+            return
+        terminal.log_to_terminal(f"Loading {len(overlays)} output(s) in the background", level="INFO")
+        for number, (path, read, colormap) in enumerate(overlays, start=1):
+            self.submit(window, path, read, colormap, terminal, number, len(overlays))
+
+    def submit(self, window, path, read, colormap, terminal, number, total):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="st_overlays")
+        self._executor.submit(self.read, window, path, read, colormap, terminal, number, total)
+
+    def read(self, window, path, read, colormap, terminal, number, total):
+        """Called in the worker"""
+        try:
+            image = read(path)
+        except Exception as err:
+            logger.info(f"Could not load {path}: {err}")
+            wx.CallAfter(log, terminal, f"Could not load {os.path.basename(path)}: {err}", "ERROR")
+            return
+        wx.CallAfter(self.add_overlay, window, path, image, colormap, terminal, number, total)
+
+    def add_overlay(self, window, path, image, colormap, terminal, number, total):
+        """Called on the GUI thread"""
+        if not window:
+            # FSLeyes was closed while the file was read
+            return
+        overlayList = window.overlayList
+        displayCtx = window.displayCtx
+        self.watch(displayCtx)
+        entry = LoadedOverlay(os.path.abspath(path), get_memory_size(image), time.monotonic())
+        self.entries[image] = entry
+
+        previous = self.find_overlay(overlayList, path)
+        if previous is None:
+            overlayList.append(image)
+            if colormap is not None:
+                displayCtx.getOpts(image).cmap = colormap
+            log(terminal, f"Loaded {image.name} ({number}/{total})", "INFO")
+        else:
+            # Take the place and the display settings of the overlay of the previous run, then drop it so that its
+            # data can be freed. Its data can't be swapped in place, the new output can have another shape, type or
+            # header
+            if previous in self.entries:
+                entry.last_selected = self.entries[previous].last_selected
+            overlayList.insert(overlayList.index(previous), image)
+            copy_display_settings(displayCtx, previous, image)
+            if displayCtx.getSelectedOverlay() is previous:
+                displayCtx.selectOverlay(image)
+            overlayList.remove(previous)
+            log(terminal, f"Reloaded {image.name} ({number}/{total})", "INFO")
+
+        self.enforce_budget(window, terminal, keep=image)
+
+    def find_overlay(self, overlayList, path):
+        """Returns the overlay the plugin loaded from ``path``, None if there is none. Overlays opened by the user are
+        not considered, even from the same file."""
+        path = os.path.abspath(path)
+        for overlay in overlayList:
+            entry = self.entries.get(overlay)
+            if entry is not None and entry.source == path:
+                return overlay
+        return None
+
+    def watch(self, displayCtx):
+        """Keep track of the selection of ``displayCtx``"""
+        if displayCtx in self._watched:
+            return
+        self._watched.add(displayCtx)
+        displayCtx.addListener('selectedOverlay', f"st_overlay_loader_{id(self)}", self.on_selected_overlay)
+
+    def on_selected_overlay(self, value, valid, displayCtx, name):
+        entry = self.entries.get(displayCtx.getSelectedOverlay())
+        if entry is not None:
+            entry.last_selected = time.monotonic()
+
+    def enforce_budget(self, window, terminal, keep=None):
+        """Memory-map or unload the least recently selected overlays of the plugin until their data in memory fits in
+        the budget. ``keep`` and the selected overlay are left as they are."""
+        if self.budget_mb < 0:
+            return
+        overlayList = window.overlayList
+        loaded = [overlay for overlay in overlayList if self.entries.get(overlay) is not None]
+        for overlay in loaded:
+            entry = self.entries[overlay]
+            # The data of a memory-mapped overlay is read in memory when all of it is accessed
+            entry.nbytes = 0 if entry.released else get_memory_size(overlay)
+        total = sum(self.entries[overlay].nbytes for overlay in loaded)
+        selected = window.displayCtx.getSelectedOverlay()
+        candidates = sorted([overlay for overlay in loaded
+                             if overlay is not keep and overlay is not selected and self.entries[overlay].nbytes > 0],
+                            key=lambda overlay: self.entries[overlay].last_selected)
+
+        for overlay in candidates:
+            if total <= self.budget_mb * 2 ** 20:
+                break
+            entry = self.entries[overlay]
+            total -= entry.nbytes
+            # Counted as released now, the memory-mapped image replaces it once it is read
+            entry.nbytes = 0
+            entry.released = True
+            if is_nifti(entry.source) and os.path.isfile(entry.source):
+                log(terminal, f"Reading {overlay.name} from disk to stay within the memory budget", "INFO")
+                self.submit(window, entry.source, read_nifti_mapped, None, terminal, 1, 1)
+            else:
+                log(terminal, f"Unloading {overlay.name} to stay within the memory budget", "INFO")
+                overlayList.remove(overlay)
+
+
+def get_memory_size(image):
+    """Returns the size of the data of an image in memory, 0 if ``read_nifti`` memory-mapped it and its data was not
+    read in memory since.
+
+    ``Image.inMemory`` alone can't tell, the NIfTI conversions of the PNG outputs are in memory before their data is
+    accessed. ``Image.dtype`` is the type of the data once read, scaled data is read as floats.
+    """
+    if image in _mapped and not image.inMemory:
+        return 0
+    return int(np.prod(image.shape)) * image.dtype.itemsize
+
+
+def read_nifti_mapped(path):
+    """Read a NIfTI file without reading its data in memory."""
+    return read_nifti(path, inmem_max_mb=0)
+
+
+def copy_display_settings(displayCtx, source, target):
+    """Give ``target`` the display settings of the overlay ``source``. Settings that don't apply to ``target``, for
+    example a volume it doesn't have, are left to their default."""
+    display_target = displayCtx.getDisplay(target)
+    display_source = displayCtx.getDisplay(source)
+    # The type of the overlay decides the type of its display options
+    display_target.overlayType = display_source.overlayType
+    copy_properties(display_source, display_target, exclude=('name', 'overlayType'))
+    copy_properties(displayCtx.getOpts(source), displayCtx.getOpts(target))
+
+
+def copy_properties(source, target, exclude=()):
+    names = set(target.getAllProperties()[0])
+    for name in source.getAllProperties()[0]:
+        if name in exclude or name not in names:
+            continue
+        try:
+            setattr(target, name, getattr(source, name))
+        except Exception as err:
+            logger.debug(f"Could not copy {name}: {err}")
+
+
+def log(terminal, msg, level):
+    if terminal.terminal:
+        terminal.log_to_terminal(msg, level=level)
+
+
+def get_overlay_loader():
+    """Returns the plugin-wide overlay loader."""
+    global _loader
+    if _loader is None:
+        _loader = OverlayLoader()
+    return _loader
@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*
+
+"""Checks of the inputs of a command before it is run
+
+The checks only use the NIfTI headers and JSON files of the inputs, through the header cache, so that a command which
+would fail on its inputs is refused right away instead of after minutes of processing.
+"""
+
+import itertools
+import json
+import numpy as np
+import os
+
+from fsleyes_plugin_shimming_toolbox.components.component import RunArgumentErrorST
+from fsleyes_plugin_shimming_toolbox.header_cache import get_header_cache, is_nifti
+
+# Options which are written by the command instead of read
+OUTPUT_OPTIONS = ['output', 'savemask']
+
+
+def parse_command(command):
+    """Split a command returned by ``RunComponent.get_run_args`` into its arguments and options.
+
+    Returns:
+        tuple: List of arguments and dictionary of options. Each option maps to a list with the values of each time
+               it appears in the command, ex: ``{'coil': [['coil1.nii', 'coil1.json'], ['coil2.nii', 'coil2.json']]}``.
+    """
+    args = []
+    options = {}
+    values = args
+    for item in command[1:]:
+        if item.startswith('--'):
+            values = []
+            options.setdefault(item[2:], []).append(values)
+        else:
+            values.append(item)
+    return args, options
+
+
+def get_option(options, name):
+    """Returns the first value of an option, None if it is not in the command."""
+    if options.get(name) and options[name][0]:
+        return options[name][0][0]
+    return None
+
+
+def get_header(path, name):
+    """Returns the header of an input file, raises ``RunArgumentErrorST`` if it cannot be read."""
+    if path is None:
+        raise RunArgumentErrorST(f"Input {name} is missing a value, please enter a valid input")
+    if not os.path.isfile(path):
+        raise RunArgumentErrorST(f"Input {name}: {path} does not exist")
+    header = get_header_cache().get(path)
+    if header is None:
+        raise RunArgumentErrorST(f"Input {name}: {path} is not a readable NIfTI file")
+    return header
+
+
+def check_ndim(header, name, ndims):
+    if len(header.shape) not in ndims:
+        expected = " or ".join(f"{ndim}D" for ndim in ndims)
+        raise RunArgumentErrorST(f"Input {name} must be {expected}, {os.path.basename(header.path)} has shape "
+                                 f"{header.shape}")
+
+
+def get_world_bounds(header):
+    """Returns the minimum and maximum scanner coordinates (mm) covered by the voxels of an image."""
+    shape = np.array(header.shape[:3])
+    corners = np.array(list(itertools.product(*[[-0.5, dim - 0.5] for dim in shape])))
+    world = corners @ header.affine[:3, :3].T + header.affine[:3, 3]
+    return world.min(axis=0), world.max(axis=0)
+
+
+def check_overlap(header1, name1, header2, name2):
+    """Raises ``RunArgumentErrorST`` if the fields of view of two images do not overlap."""
+    min1, max1 = get_world_bounds(header1)
+    min2, max2 = get_world_bounds(header2)
+    if np.any(np.minimum(max1, max2) <= np.maximum(min1, min2)):
+        raise RunArgumentErrorST(f"The field of view of {name1} ({os.path.basename(header1.path)}) does not overlap "
+                                 f"with the field of view of {name2} ({os.path.basename(header2.path)})")
+
+
+def check_same_grid(header1, name1, header2, name2):
+    if header1.shape[:3] != header2.shape[:3] or not np.allclose(header1.affine, header2.affine, atol=1e-3):
+        raise RunArgumentErrorST(f"{name1} ({os.path.basename(header1.path)}) and {name2} "
+                                 f"({os.path.basename(header2.path)}) must have the same shape and orientation, "
+                                 f"got {header1.shape} and {header2.shape}")
+
+
+def check_json(path, name):
+    if not os.path.isfile(path):
+        raise RunArgumentErrorST(f"Input {name}: {path} does not exist")
+    try:
+        with open(path) as f:
+            json.load(f)
+    except (OSError, ValueError) as err:
+        raise RunArgumentErrorST(f"Input {name}: {path} is not a valid JSON file: {err}")
+
+
+def check_nifti_inputs(args, options):
+    """Every NIfTI path given as an input must be readable."""
+    for name, occurrences in itertools.chain([('arg', [args])], options.items()):
+        if name in OUTPUT_OPTIONS:
+            continue
+        for values in occurrences:
+            for value in values:
+                if is_nifti(value):
+                    get_header(value, name)
+
+
+def check_coils(options):
+    for i_coil, values in enumerate(options.get('coil', []) + options.get('coil-riro', [])):
+        if len(values) != 2:
+            raise RunArgumentErrorST(f"Coil {i_coil + 1} needs a NIfTI file and a JSON constraint file")
+        check_ndim(get_header(values[0], f"coil {i_coil + 1}"), f"coil {i_coil + 1}", [4])
+        check_json(values[1], f"coil {i_coil + 1} constraints")
+    constraints = get_option(options, 'scanner-coil-constraints')
+    if constraints is not None:
+        check_json(constraints, 'scanner-coil-constraints')
+
+
+def check_b0shim(args, options, realtime=False):
+    fmap = get_header(get_option(options, 'fmap'), 'fmap')
+    anat = get_header(get_option(options, 'anat'), 'anat')
+    if realtime:
+        # The realtime fieldmap is a timeseries, the respiratory trace gives the pressure of each volume
+        check_ndim(fmap, 'fmap', [4])
+        resp = get_option(options, 'resp')
+        if resp is None or not os.path.isfile(resp):
+            raise RunArgumentErrorST(f"Input resp: {resp} does not exist")
+        masks = ['mask-static', 'mask-riro']
+    else:
+        check_ndim(fmap, 'fmap', [3])
+        masks = ['mask']
+    check_ndim(anat, 'anat', [3, 4])
+    check_overlap(fmap, 'fmap', anat, 'anat')
+    for name in masks:
+        if get_option(options, name) is not None:
+            mask = get_header(get_option(options, name), name)
+            check_ndim(mask, name, [3])
+            check_overlap(mask, name, anat, 'anat')
+    check_coils(options)
+
+
+def check_prepare_fieldmap(args, options):
+    phases = [get_header(path, f"phase {i + 1}") for i, path in enumerate(args)]
+    if not phases:
+        raise RunArgumentErrorST("At least one phase input is required")
+    mag = get_header(get_option(options, 'mag'), 'mag')
+    for i, phase in enumerate(phases):
+        check_same_grid(phase, f"Phase {i + 1}", mag, "mag")
+    if get_option(options, 'mask') is not None:
+        check_same_grid(get_header(get_option(options, 'mask'), 'mask'), "mask", phases[0], "phase 1")
+
+    # Each echo has its own echo time, a single input is a phase difference with both echo times
+    for phase in phases:
+        if not phase.sidecar:
+            raise RunArgumentErrorST(f"{os.path.basename(phase.path)} has no JSON sidecar, it is needed for the echo "
+                                     f"times")
+    if len(phases) == 1:
+        sidecar = phases[0].sidecar
+        if 'EchoTime' not in sidecar and not ('EchoTime1' in sidecar and 'EchoTime2' in sidecar):
+            raise RunArgumentErrorST(f"The JSON sidecar of {os.path.basename(phases[0].path)} must contain "
+                                     f"EchoTime or EchoTime1 and EchoTime2")
+    else:
+        echo_times = [phase.sidecar.get('EchoTime') for phase in phases]
+        if None in echo_times:
+            raise RunArgumentErrorST("The JSON sidecars of all the phase inputs must contain EchoTime")
+        if len(set(echo_times)) != len(echo_times):
+            raise RunArgumentErrorST(f"The phase inputs must be different echoes, got echo times {echo_times}")
+
+
+def check_b1shim(args, options):
+    b1 = get_header(get_option(options, 'b1'), 'b1')
+    # The B+1 maps of all the transmit channels are stacked along the 4th dimension
+    check_ndim(b1, 'b1', [4])
+    if get_option(options, 'mask') is not None:
+        mask = get_header(get_option(options, 'mask'), 'mask')
+        check_ndim(mask, 'mask', [3])
+        check_overlap(mask, 'mask', b1, 'b1')
+    if get_option(options, 'vop') is not None and not os.path.isfile(get_option(options, 'vop')):
+        raise RunArgumentErrorST(f"Input vop: {get_option(options, 'vop')} does not exist")
+
+
+# Checks specific to each st_function, keyed by the beginning of the st_function
+CHECKS = {
+    'st_b0shim dynamic': check_b0shim,
+    'st_b0shim realtime-dynamic': lambda args, options: check_b0shim(args, options, realtime=True),
+    'st_prepare_fieldmap': check_prepare_fieldmap,
+    'st_b1shim': check_b1shim,
+}
+
+
+def preflight(st_function, command):
+    """Check the inputs of ``command`` from their headers.
+
+    Args:
+        st_function (str): Name of the ``Shimming Toolbox`` CLI function, ex: ``st_b0shim dynamic``.
+        command (list of str): Command returned by ``RunComponent.get_run_args``.
+
+    Raises:
+        RunArgumentErrorST: If an input is missing or is not compatible with the other inputs.
+    """
+    args, options = parse_command(command)
+    check_nifti_inputs(args, options)
+    for name, check in CHECKS.items():
+        if st_function.startswith(name):
+            check(args, options)
@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*
+
+"""Cache of the outputs of the ``Shimming Toolbox`` CLIs
+
+An entry is keyed on the command, on the content of its input files and on the version of ``shimmingtoolbox``. The
+options in ``preflight.OUTPUT_OPTIONS`` are written by the command, what their files contained before the run is not
+part of the key. The output folder is replaced by a placeholder in the key so that a result can be restored into a
+different output folder.
+Each entry is a folder containing the files that the CLI created or modified in its output folder and a ``meta.json``
+file.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from fsleyes_plugin_shimming_toolbox import HOME_DIR
+from fsleyes_plugin_shimming_toolbox.components.help_index import get_st_version
+from fsleyes_plugin_shimming_toolbox.preflight import OUTPUT_OPTIONS, parse_command
+
+CACHE_DIR = os.environ.get('ST_PLUGIN_CACHE_DIR',
+                           os.path.join(HOME_DIR, '.cache', 'fsleyes-plugin-shimming-toolbox', 'results'))
+# Maximum size of the cache on disk
+CACHE_SIZE_MB = float(os.environ.get('ST_PLUGIN_CACHE_SIZE_MB', 2048))
+OUTPUT_PLACEHOLDER = '<output>'
+CHUNK_SIZE = 2 ** 20
+
+_cache = None
+
+
+def get_output_folder(output):
+    """Returns the folder containing the outputs of a CLI given the value of its output option."""
+    if not output:
+        return ""
+    if os.path.isdir(output) or not os.path.splitext(output)[1]:
+        return os.path.abspath(output)
+    return os.path.dirname(os.path.abspath(output))
+
+
+def snapshot(folder):
+    """Returns the size and modification time of all the files in ``folder``, keyed by their path relative to it."""
+    files = {}
+    if not folder or not os.path.isdir(folder):
+        return files
+    for root, _, fnames in os.walk(folder):
+        for fname in fnames:
+            path = os.path.join(root, fname)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files[os.path.relpath(path, folder)] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def changed_files(folder, before):
+    """Returns the paths relative to ``folder`` of the files created or modified since the ``before`` snapshot."""
+    after = snapshot(folder)
+    return sorted(path for path, stat in after.items() if before.get(path) != stat)
+
+
+class ResultCache:
+    """Content-addressed cache of CLI outputs with a size cap and least recently used eviction.
+
+    Hashing the inputs and copying the outputs can take seconds on large inputs, the methods of the cache are called
+    from worker threads, never from the GUI thread.
+
+    Attributes:
+        path (str): Folder of the cache.
+        max_bytes (int): Entries are evicted, least recently used first, when the cache is larger than this.
+        st_version (str): Version of ``shimmingtoolbox``, results of other versions are not reused.
+    """
+
+    def __init__(self, path=CACHE_DIR, max_bytes=int(CACHE_SIZE_MB * 1024 ** 2), st_version=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.st_version = st_version if st_version is not None else get_st_version()
+        # Content hash of the input files keyed by (path, size, mtime) so that unchanged inputs are not read again
+        self.fingerprints = {}
+        self._lock = threading.Lock()
+
+    def make_key(self, command, output, load_in_overlay=()):
+        """Returns the key of a command.
+
+        Args:
+            command (list of str): Command returned by ``RunComponent.get_run_args``.
+            output (str): Value of the output option of the command.
+            load_in_overlay (list of str): Output files of the command which are not under its output folder.
+
+        Returns:
+            str: Key of the command, None if an input could not be read.
+        """
+        folder = get_output_folder(output)
+        outputs = {os.path.abspath(path) for path in list(load_in_overlay) + [output] if path}
+        args, options = parse_command(command)
+        inputs = {os.path.abspath(value) for value in args}
+        for name, occurrences in options.items():
+            if name not in OUTPUT_OPTIONS:
+                inputs.update(os.path.abspath(value) for values in occurrences for value in values)
+        digest = hashlib.sha256()
+        digest.update(f"shimmingtoolbox {self.st_version}".encode() + b'\0')
+        for arg in command:
+            path = os.path.abspath(arg)
+            is_input = path in inputs and path not in outputs and os.path.exists(path)
+            if folder and (path == folder or path.startswith(folder + os.sep)):
+                arg = OUTPUT_PLACEHOLDER + path[len(folder):]
+            digest.update(arg.encode() + b'\0')
+            if is_input:
+                fingerprint = self.fingerprint(path)
+                if fingerprint is None:
+                    return None
+                digest.update(fingerprint.encode() + b'\0')
+        return digest.hexdigest()
+
+    def fingerprint(self, path):
+        """Returns the hash of the content of a file or of all the files in a folder."""
+        if os.path.isdir(path):
+            digest = hashlib.sha256()
+            for root, dirs, fnames in os.walk(path):
+                dirs.sort()
+                for fname in sorted(fnames):
+                    fingerprint = self.fingerprint(os.path.join(root, fname))
+                    if fingerprint is None:
+                        return None
+                    digest.update(os.path.relpath(os.path.join(root, fname), path).encode() + b'\0')
+                    digest.update(fingerprint.encode())
+            return digest.hexdigest()
+
+        try:
+            stat = os.stat(path)
+            stat_key = (path, stat.st_size, stat.st_mtime_ns)
+            if stat_key not in self.fingerprints:
+                digest = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                self.fingerprints[stat_key] = digest.hexdigest()
+            return self.fingerprints[stat_key]
+        except OSError:
+            return None
+
+    def lookup(self, command, output, load_in_overlay=()):
+        """Restore the result of ``command`` if it is cached, otherwise prepare to store it once it has run.
+
+        Returns:
+            tuple: Key of the command (None if it can't be cached), paths of the restored files (None if there was no
+                   entry) and snapshot of the output folder to pass to ``store_changes`` (None if it was restored).
+        """
+        key = self.make_key(command, output, load_in_overlay)
+        if key is None:
+            return None, None, {}
+        restored = self.restore(key, output)
+        if restored is not None:
+            return key, restored, None
+        return key, None, snapshot(get_output_folder(output))
+
+    def store_changes(self, key, output, before, load_in_overlay=()):
+        """Store the files created or modified in the output folder of ``output`` since the ``before`` snapshot.
+
+        Returns:
+            bool: True if an entry was added.
+        """
+        folder = get_output_folder(output)
+        files = changed_files(folder, before)
+        # The cache only restores files of the output folder
+        outside = [fname for fname in load_in_overlay if not os.path.abspath(fname).startswith(folder + os.sep)]
+        if not files or outside:
+            return False
+        return self.store(key, output, files)
+
+    def restore(self, key, output):
+        """Copy the files of an entry into the output folder of ``output``.
+
+        Returns:
+            list of str: Paths of the restored files, None if there is no entry for ``key``.
+        """
+        path_entry = os.path.join(self.path, key)
+        with self._lock:
+            meta = self.read_meta(path_entry)
+            if meta is None:
+                return None
+            folder = get_output_folder(output)
+            restored = []
+            try:
+                for fname in meta['files']:
+                    path_out = os.path.join(folder, fname)
+                    os.makedirs(os.path.dirname(path_out), exist_ok=True)
+                    shutil.copy2(os.path.join(path_entry, 'files', fname), path_out)
+                    restored.append(path_out)
+            except OSError:
+                # The entry is incomplete
+                shutil.rmtree(path_entry, ignore_errors=True)
+                return None
+            meta['last_used'] = time.time()
+            self.write_meta(path_entry, meta)
+        return restored
+
+    def store(self, key, output, files):
+        """Add an entry with ``files``, paths relative to the output folder of ``output``, then evict old entries.
+
+        Returns:
+            bool: True if the entry was added.
+        """
+        folder = get_output_folder(output)
+        path_entry = os.path.join(self.path, key)
+        path_tmp = path_entry + '.tmp'
+        with self._lock:
+            shutil.rmtree(path_tmp, ignore_errors=True)
+            size = 0
+            try:
+                for fname in files:
+                    path_in_cache = os.path.join(path_tmp, 'files', fname)
+                    os.makedirs(os.path.dirname(path_in_cache), exist_ok=True)
+                    shutil.copy2(os.path.join(folder, fname), path_in_cache)
+                    size += os.path.getsize(path_in_cache)
+                self.write_meta(path_tmp, {'files': list(files), 'size': size, 'last_used': time.time()})
+                shutil.rmtree(path_entry, ignore_errors=True)
+                os.replace(path_tmp, path_entry)
+            except OSError:
+                shutil.rmtree(path_tmp, ignore_errors=True)
+                return False
+            self.evict()
+        return True
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in ``max_bytes``. Called with the lock held."""
+        entries = []
+        for key in os.listdir(self.path) if os.path.isdir(self.path) else []:
+            meta = self.read_meta(os.path.join(self.path, key))
+            if meta is not None:
+                entries.append((meta['last_used'], meta['size'], key))
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+            total -= size
+
+    @staticmethod
+    def read_meta(path_entry):
+        try:
+            with open(os.path.join(path_entry, 'meta.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def write_meta(path_entry, meta):
+        os.makedirs(path_entry, exist_ok=True)
+        with open(os.path.join(path_entry, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+
+def get_result_cache():
+    """Returns the plugin-wide result cache."""
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
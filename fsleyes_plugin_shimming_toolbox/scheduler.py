@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*
+
+import itertools
+import os
+import threading
+import wx
+
+from fsleyes_plugin_shimming_toolbox.events import get_dispatcher, log_event_type, LogEvent
+from fsleyes_plugin_shimming_toolbox.events import result_event_type, ResultEvent, STATUS_CANCELLED
+from fsleyes_plugin_shimming_toolbox.engine import get_engine
+
+# Maximum number of CLIs running at the same time across all the tabs
+MAX_JOBS = int(os.environ.get('ST_PLUGIN_MAX_JOBS', 2))
+# Number of cores the running CLIs can use altogether
+CPU_BUDGET = int(os.environ.get('ST_PLUGIN_CPU_BUDGET', os.cpu_count() or 1))
+# Number of cores allocated to each CLI
+CORES_PER_JOB = int(os.environ.get('ST_PLUGIN_CORES_PER_JOB', max(1, CPU_BUDGET // MAX_JOBS)))
+# Wall-clock timeout in seconds per st_function, ex: "st_prepare_fieldmap=600;st_b0shim dynamic=1800"
+TIMEOUTS_ENV = os.environ.get('ST_PLUGIN_TIMEOUTS', '')
+
+_scheduler = None
+_job_ids = itertools.count(1)
+
+
+def get_available_cpus():
+    """Returns the ids of the CPUs FSLeyes is allowed to run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_timeouts(value):
+    """Parse ``"name=seconds;name=seconds"`` into a dictionary."""
+    timeouts = {}
+    for item in value.split(';'):
+        if '=' not in item:
+            continue
+        name, seconds = item.rsplit('=', 1)
+        timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+TIMEOUTS = parse_timeouts(TIMEOUTS_ENV)
+
+
+class Job:
+    """A ``Shimming Toolbox`` CLI call submitted to the ``JobScheduler``.
+
+    Attributes:
+        id (int): Unique id of the job, used to route its log and result events.
+        cmd (list of str): Command to run.
+        name (str): Name of the ``st_function``.
+        cores (int): Number of cores allocated to the job.
+        cpus (list of int): Ids of the CPUs the job is pinned to while it runs.
+        timeout (float): Wall-clock timeout in seconds, None for no timeout.
+        status (str): One of ``queued``, ``running`` or ``done``.
+        pid (int): Process id of the CLI, it is also the id of its process group.
+        returncode (int): Return code of the CLI once it exited.
+        cancel_status (str): ``STATUS_CANCELLED`` or ``STATUS_TIMED_OUT`` if the job was stopped.
+        resource_usage (ResourceUsage): Wall time, CPU time and peak memory of the CLI once it exited.
+    """
+
+    def __init__(self, cmd, name, cores=None, timeout=None):
+        self.id = next(_job_ids)
+        self.cmd = cmd
+        self.name = name
+        self.cores = cores if cores is not None else CORES_PER_JOB
+        self.cpus = []
+        self.timeout = timeout if timeout is not None else TIMEOUTS.get(name)
+        self.status = 'queued'
+        self.future = None
+        self.pid = None
+        self.returncode = None
+        self.cancel_status = None
+        self.resource_usage = None
+
+
+class JobScheduler:
+    """Plugin-wide scheduler which runs the submitted jobs in a bounded pool.
+
+    A job is started when fewer than ``max_jobs`` jobs are running and its cores fit in what is left of
+    ``cpu_budget``. Jobs are started in submission order. Each running job is given its own set of CPUs so that
+    concurrent jobs do not compete for the same cores.
+    """
+
+    def __init__(self, max_jobs=MAX_JOBS, cpu_budget=CPU_BUDGET):
+        self.max_jobs = max(1, max_jobs)
+        self.cpu_budget = max(1, cpu_budget)
+        self.free_cpus = get_available_cpus()[:self.cpu_budget]
+        self.queue = []
+        self.running = []
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self):
+        return len(self.queue)
+
+    @property
+    def running_jobs(self):
+        return list(self.running)
+
+    @property
+    def cores_in_use(self):
+        return sum(job.cores for job in self.running)
+
+    def status_message(self):
+        return f"{len(self.running)} job(s) running, {len(self.queue)} queued"
+
+    def add_listener(self, callback):
+        """``callback(scheduler)`` is called from any thread when jobs are queued, started or finished."""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def submit(self, job):
+        """Queue a job, it is started as soon as there are enough resources.
+
+        Returns:
+            bool: True if the job started right away, False if it is waiting in the queue.
+        """
+        # A job can never use more than the whole budget
+        job.cores = min(max(1, job.cores), self.cpu_budget)
+        with self._lock:
+            self.queue.append(job)
+            self.start_ready_jobs()
+        self.notify()
+        return job.status == 'running'
+
+    def cancel(self, job):
+        """Cancel a queued or running job. A ``ResultEvent`` with the ``STATUS_CANCELLED`` status is posted."""
+        with self._lock:
+            queued = job in self.queue
+            if queued:
+                self.queue.remove(job)
+                job.status = 'done'
+                job.cancel_status = STATUS_CANCELLED
+
+        if queued:
+            evt = ResultEvent(result_event_type, -1, job.name, job_id=job.id)
+            evt.set_data(None)
+            evt.set_status(STATUS_CANCELLED)
+            wx.PostEvent(get_dispatcher(), evt)
+            self.notify()
+        elif job.status == 'running':
+            get_engine().cancel(job)
+
+    def job_finished(self, job):
+        with self._lock:
+            job.status = 'done'
+            if job in self.running:
+                self.running.remove(job)
+                self.free_cpus = sorted(self.free_cpus + job.cpus)
+            started = self.start_ready_jobs()
+        for started_job in started:
+            evt = LogEvent(log_event_type, -1, started_job.name, job_id=started_job.id)
+            evt.set_data(f"Starting {started_job.name} ({self.status_message()})")
+            wx.PostEvent(get_dispatcher(), evt)
+        self.notify()
+
+    def start_ready_jobs(self):
+        """Start the jobs at the head of the queue while there are resources. Must be called with the lock held."""
+        started = []
+        while self.queue and len(self.running) < self.max_jobs and \
+                self.cores_in_use + self.queue[0].cores <= self.cpu_budget:
+            job = self.queue.pop(0)
+            job.cpus = self.free_cpus[:job.cores]
+            self.free_cpus = self.free_cpus[job.cores:]
+            job.status = 'running'
+            self.running.append(job)
+            job.future = get_engine().submit(job, callback=lambda job=job: self.job_finished(job))
+            started.append(job)
+        return started
+
+    def notify(self):
+        for callback in list(self.listeners):
+            callback(self)
+
+
+def get_scheduler():
+    """Returns the plugin-wide scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = JobScheduler()
+    return _scheduler
@@ -18,6 +18,8 @@ Authors: Alexandre D'Astous, Ainsleigh Hill, Gaspard Cereza, Julien Cohen-Adad
 
 import fsleyes.controls.controlpanel as ctrlpanel
 import fsleyes.views.canvaspanel as canvaspanel
+import inspect
+import os
 import textwrap
 import wx
 
@@ -26,6 +28,11 @@ from fsleyes_plugin_shimming_toolbox.tabs.b1shim_tab import B1ShimTab
 from fsleyes_plugin_shimming_toolbox.tabs.dicom_to_nifti_tab import DicomToNiftiTab
 from fsleyes_plugin_shimming_toolbox.tabs.fieldmap_tab import FieldMapTab
 from fsleyes_plugin_shimming_toolbox.tabs.mask_tab import MaskTab
+from fsleyes_plugin_shimming_toolbox.events import get_dispatcher
+from fsleyes_plugin_shimming_toolbox.scheduler import get_scheduler
+from fsleyes_plugin_shimming_toolbox.terminal_lines import TerminalLines
+from fsleyes_plugin_shimming_toolbox.warm_worker import start_warm_worker
+from fsleyes_plugin_shimming_toolbox.engine import get_st_env, PATH_ST_VENV
 
 STLayout = textwrap.dedent(
     """
@@ -36,6 +43,9 @@ STLayout = textwrap.dedent(
     """
 )
 
+# Number of lines kept in the terminal, older lines are moved to a file on disk
+TERMINAL_MAX_LINES = int(os.environ.get('ST_PLUGIN_TERMINAL_LINES', 10000))
+
 
 # We need to create a ctrlpanel.ControlPanel instance so that it can be recognized as a plugin by FSLeyes
 # Class hierarchy: wx.Panel > fslpanel.FSLeyesPanel > ctrlpanel.ControlPanel
@@ -59,20 +69,22 @@ class STControlPanel(ctrlpanel.ControlPanel):
 
         """
         super().__init__(parent, overlayList, displayCtx, ctrlPanel)
+        # Start importing the CLIs in the background so that the worker is warm by the first run (opt-in)
+        start_warm_worker(os.path.join(PATH_ST_VENV, 'python'), env=get_st_env())
+        # Create the dispatcher of the job events on the GUI thread
+        get_dispatcher()
+
         # Create a notebook with a terminal to navigate between the different functions.
         nb = NotebookTerminal(self)
 
-        # Create the different tabs. Use 'select' to choose the default tab displayed at startup
-        tab1 = DicomToNiftiTab(nb)
-        tab2 = FieldMapTab(nb)
-        tab3 = MaskTab(nb)
-        tab4 = B0ShimTab(nb)
-        tab5 = B1ShimTab(nb)
-        nb.AddPage(tab1, tab1.title)
-        nb.AddPage(tab2, tab2.title)
-        nb.AddPage(tab3, tab3.title)
-        nb.AddPage(tab4, tab4.title, select=True)
-        nb.AddPage(tab5, tab5.title)
+        # Create the different tabs. Use 'select' to choose the default tab displayed at startup. Only the default tab
+        # is built now, the others are built the first time they are selected.
+        nb.add_lazy_page(DicomToNiftiTab)
+        nb.add_lazy_page(FieldMapTab)
+        nb.add_lazy_page(MaskTab)
+        tab_b0shim = B0ShimTab(nb)
+        nb.AddPage(tab_b0shim, tab_b0shim.title, select=True)
+        nb.add_lazy_page(B1ShimTab)
 
         self.sizer = wx.BoxSizer(wx.HORIZONTAL)
         self.sizer.AddSpacer(5)
@@ -88,22 +100,143 @@ class NotebookTerminal(wx.Notebook):
     def __init__(self, parent):
         super().__init__(parent)
         self.terminal_component = Terminal(parent)
+        self.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED, self.on_page_changed)
+
+    def add_lazy_page(self, tab_class, select=False):
+        """Add a placeholder page which is replaced by an instance of ``tab_class`` when it is first selected. The page
+        has the default title of ``tab_class``."""
+        title = get_default_title(tab_class)
+        self.AddPage(PlaceholderPage(self, tab_class, title), title, select=select)
+
+    def on_page_changed(self, event):
+        index = event.GetSelection()
+        if index != wx.NOT_FOUND and isinstance(self.GetPage(index), PlaceholderPage):
+            self.build_page(index)
+        event.Skip()
+
+    def build_page(self, index):
+        """Replace the placeholder at ``index`` by its tab. The tab keeps the notebook as its parent."""
+        placeholder = self.GetPage(index)
+        self.Freeze()
+        try:
+            tab = placeholder.tab_class(self, title=placeholder.title)
+            self.InsertPage(index, tab, placeholder.title, select=True)
+            self.RemovePage(index + 1)
+            placeholder.Destroy()
+        finally:
+            self.Thaw()
+        return tab
+
+
+def get_default_title(tab_class):
+    """Returns the default value of the ``title`` argument of a tab class, without building the tab."""
+    return inspect.signature(tab_class.__init__).parameters['title'].default
+
+
+class PlaceholderPage(wx.Panel):
+    """Empty page standing for a tab which has not been built yet."""
+    def __init__(self, parent, tab_class, title):
+        super().__init__(parent)
+        self.tab_class = tab_class
+        self.title = title
+
+
+class TerminalView(wx.ListCtrl):
+    """Virtual list which only renders the lines of the terminal that are visible."""
+    def __init__(self, parent, lines):
+        super().__init__(parent, wx.ID_ANY, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_NO_HEADER)
+        self.lines = lines
+        self.InsertColumn(0, "")
+        self.SetBackgroundColour(wx.BLACK)
+        self.SetTextColour(wx.WHITE)
+        self.Bind(wx.EVT_SIZE, self.on_size)
+
+    def OnGetItemText(self, item, column):
+        return self.lines[item]
+
+    def on_size(self, event):
+        self.SetColumnWidth(0, max(self.GetClientSize()[0], 1))
+        event.Skip()
+
+    def is_scrolled_to_bottom(self):
+        count = self.GetItemCount()
+        return count == 0 or self.GetTopItem() + self.GetCountPerPage() >= count - 1
 
 
 class Terminal:
-    """Create the terminal where messages are logged to the user."""
-    def __init__(self, panel):
+    """Create the terminal where messages are logged to the user.
+
+    The terminal keeps the last ``max_lines`` lines in memory, older lines are appended to a file (see
+    ``TerminalLines``).
+    """
+    def __init__(self, panel, max_lines=TERMINAL_MAX_LINES):
         self.panel = panel
-        self.terminal = wx.TextCtrl(self.panel, wx.ID_ANY, style=wx.TE_MULTILINE | wx.TE_READONLY)
-        self.terminal.SetDefaultStyle(wx.TextAttr(wx.WHITE, wx.BLACK))
-        self.terminal.SetBackgroundColour(wx.BLACK)
+        self.lines = TerminalLines(max_lines)
+        self.terminal = TerminalView(self.panel, self.lines)
+        self.terminal.Bind(wx.EVT_CONTEXT_MENU, self.on_context_menu)
+        # Jobs running and queued in the scheduler
+        self.job_status = wx.StaticText(self.panel, label="")
         self.sizer = wx.BoxSizer(wx.VERTICAL)
         self.sizer.AddSpacer(5)
         self.sizer.Add(self.terminal, 1, wx.EXPAND)
+        self.sizer.Add(self.job_status, 0, wx.EXPAND | wx.TOP, 2)
         self.sizer.AddSpacer(5)
 
-    def log_to_terminal(self, msg, level=None):
-        if level is None:
-            self.terminal.AppendText(f"{msg}\n")
+        get_scheduler().add_listener(self.on_scheduler_update)
+        self.terminal.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
+
+    def on_scheduler_update(self, scheduler):
+        # The scheduler can notify from a worker thread
+        wx.CallAfter(self.update_job_status, scheduler)
+
+    def update_job_status(self, scheduler):
+        if not self.job_status:
+            # The panel was closed
+            return
+        if scheduler.running_jobs or scheduler.queue_depth:
+            names = ', '.join(job.name for job in scheduler.running_jobs)
+            self.job_status.SetLabel(f"Jobs: {scheduler.status_message()} [{names}]")
         else:
-            self.terminal.AppendText(f"{level}: {msg}\n")
+            self.job_status.SetLabel("")
+
+    def on_destroy(self, event):
+        get_scheduler().remove_listener(self.on_scheduler_update)
+        self.lines.close()
+        event.Skip()
+
+    def log_to_terminal(self, msg, level=None):
+        if level is not None:
+            msg = f"{level}: {msg}"
+        new_lines = str(msg).splitlines() or [""]
+
+        follow = self.terminal.is_scrolled_to_bottom()
+        n_spilled = self.lines.extend(new_lines)
+        self.terminal.SetItemCount(len(self.lines))
+        if n_spilled > 0:
+            # The lines shifted up, the visible ones need to be redrawn
+            self.terminal.Refresh()
+        if follow:
+            self.terminal.EnsureVisible(len(self.lines) - 1)
+
+    def on_context_menu(self, event):
+        menu = wx.Menu()
+        item_copy = menu.Append(wx.ID_ANY, "Copy selected lines")
+        item_history = menu.Append(wx.ID_ANY, f"Open older output ({self.lines.n_lines_history} lines)")
+        item_history.Enable(self.lines.n_lines_history > 0)
+        self.terminal.Bind(wx.EVT_MENU, self.on_copy, item_copy)
+        self.terminal.Bind(wx.EVT_MENU, self.on_open_history, item_history)
+        self.terminal.PopupMenu(menu)
+        menu.Destroy()
+
+    def on_copy(self, event):
+        selected = []
+        item = self.terminal.GetFirstSelected()
+        while item != -1:
+            selected.append(self.lines[item])
+            item = self.terminal.GetNextSelected(item)
+        if selected and wx.TheClipboard.Open():
+            wx.TheClipboard.SetData(wx.TextDataObject('\n'.join(selected)))
+            wx.TheClipboard.Close()
+
+    def on_open_history(self, event):
+        wx.LaunchDefaultApplication(self.lines.path_history)
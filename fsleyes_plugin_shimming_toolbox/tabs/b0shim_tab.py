@@ -11,9 +11,9 @@ from fsleyes_plugin_shimming_toolbox.components.input_component import InputComp
 from fsleyes_plugin_shimming_toolbox.components.run_component import RunComponent
 from fsleyes_plugin_shimming_toolbox.components.checkbox_component import CheckboxComponent
 
-from shimmingtoolbox.cli.b0shim import dynamic as dynamic_cli
-from shimmingtoolbox.cli.b0shim import realtime_dynamic as realtime_cli
-from shimmingtoolbox.cli.b0shim import max_intensity as max_intensity_cli
+dynamic_cli = 'shimmingtoolbox.cli.b0shim:dynamic'
+realtime_cli = 'shimmingtoolbox.cli.b0shim:realtime_dynamic'
+max_intensity_cli = 'shimmingtoolbox.cli.b0shim:max_intensity'
 
 
 class B0ShimTab(Tab):
@@ -62,18 +62,21 @@ class B0ShimTab(Tab):
 
         self.create_choice_box()
 
-        self.create_dropdown_sizers()
         self.parent_sizer = self.create_sizer()
         self.SetSizer(self.parent_sizer)
 
-        # Run on choice to select the default choice from the choice box widget
+        # Run on choice to select the default choice from the choice box widget, this creates its sizer
         self.on_choice(None)
 
-    def create_dropdown_sizers(self):
+    def create_dropdown_sizer(self, selection):
+        """Create the sizer of an algorithm of the choice box. Called the first time the algorithm is chosen, the
+        sizer is then kept with its values.
+        """
         for dropdown_dict in self.dropdown_metadata:
-            sizer = dropdown_dict["sizer_function"]()
-            self.sizer_run.Add(sizer, 0, wx.EXPAND)
-            self.positions[dropdown_dict["name"]] = self.sizer_run.GetItemCount() - 1
+            if dropdown_dict["name"] == selection:
+                sizer = dropdown_dict["sizer_function"]()
+                self.sizer_run.Add(sizer, 0, wx.EXPAND)
+                self.positions[selection] = self.sizer_run.GetItemCount() - 1
 
     def on_choice(self, event):
         # Get the selection from the choice box widget
@@ -83,30 +86,32 @@ class B0ShimTab(Tab):
         else:
             selection = self.choice_box.GetString(self.choice_box.GetSelection())
 
+        if selection not in self.positions.keys():
+            self.create_dropdown_sizer(selection)
+
         # Unshow everything then show the correct item according to the choice box
         self.unshow_choice_box_sizers()
         if selection in self.positions.keys():
             run_component_sizer_item = self.sizer_run.GetItem(self.positions[selection])
             run_component_sizer_item.Show(True)
 
-            # When doing Show(True), we show everything in the sizer, we need to call the dropdowns that can contain
+            # When doing Show(True), we show everything in the sizer, we need to resolve the dropdowns that can contain
             # items to show the appropriate things according to their current choice.
             if selection == 'Dynamic/volume':
-                self.dropdown_slice_dyn.on_choice(None)
-                self.dropdown_coil_format_dyn.on_choice(None)
-                self.checkbox_scanner_order_dyn.on_choice(None)
-                self.dropdown_opt_dyn.on_choice(None)
+                self.dropdown_slice_dyn.resolve()
+                self.dropdown_coil_format_dyn.resolve()
+                self.checkbox_scanner_order_dyn.resolve()
+                self.dropdown_opt_dyn.resolve()
             elif selection == 'Realtime Dynamic':
-                self.dropdown_slice_rt.on_choice(None)
-                self.dropdown_coil_format_rt.on_choice(None)
-                self.checkbox_scanner_order_rt.on_choice(None)
-                self.dropdown_opt_rt.on_choice(None)
+                self.dropdown_slice_rt.resolve()
+                self.dropdown_coil_format_rt.resolve()
+                self.checkbox_scanner_order_rt.resolve()
+                self.dropdown_opt_rt.resolve()
         else:
             pass
 
         # Update the window
-        self.SetVirtualSize(self.sizer_run.GetMinSize())
-        self.Layout()
+        self.request_layout()
 
     def unshow_choice_box_sizers(self):
         """Set the Show variable to false for all sizers of the choice box widget"""
@@ -345,8 +350,6 @@ class B0ShimTab(Tab):
             cli=dynamic_cli
         )
 
-        dropdown_crit.add_dropdown_parent(self.dropdown_opt_dyn)
-
         dropdown_slice_metadata = [
             {
                 "label": "Auto detect",
@@ -445,9 +448,6 @@ class B0ShimTab(Tab):
                              dropdown_fatsat2]
         )
 
-        dropdown_fatsat1.add_dropdown_parent(self.dropdown_coil_format_dyn)
-        dropdown_fatsat2.add_dropdown_parent(self.dropdown_coil_format_dyn)
-
         self.run_component_dyn = RunComponent(
             panel=self,
             list_components=[self.component_coils_dyn, component_inputs, self.dropdown_opt_dyn, self.dropdown_slice_dyn,
@@ -674,8 +674,6 @@ class B0ShimTab(Tab):
             cli=realtime_cli
         )
 
-        dropdown_crit.add_dropdown_parent(self.dropdown_opt_rt)
-
         dropdown_slice_metadata = [
             {
                 "label": "Auto detect",
@@ -751,8 +749,6 @@ class B0ShimTab(Tab):
                              dropdown_fatsat]
         )
 
-        dropdown_fatsat.add_dropdown_parent(self.dropdown_coil_format_rt)
-
         self.run_component_rt = RunComponent(
             panel=self,
             list_components=[self.component_coils_rt, component_inputs, self.dropdown_opt_rt,
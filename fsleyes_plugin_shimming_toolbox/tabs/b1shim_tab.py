@@ -9,7 +9,7 @@ from fsleyes_plugin_shimming_toolbox.tabs.tab import Tab
 from fsleyes_plugin_shimming_toolbox.components.input_component import InputComponent
 from fsleyes_plugin_shimming_toolbox.components.run_component import RunComponent
 
-from shimmingtoolbox.cli.b1shim import b1shim_cli
+b1shim_cli = 'shimmingtoolbox.cli.b1shim:b1shim_cli'
 
 
 class B1ShimTab(Tab):
@@ -43,18 +43,21 @@ class B1ShimTab(Tab):
 
         self.create_choice_box()
 
-        self.create_dropdown_sizers()
         self.parent_sizer = self.create_sizer()
         self.SetSizer(self.parent_sizer)
 
-        # Run on choice to select the default choice from the choice box widget
+        # Run on choice to select the default choice from the choice box widget, this creates its sizer
         self.on_choice(None)
 
-    def create_dropdown_sizers(self):
+    def create_dropdown_sizer(self, selection):
+        """Create the sizer of an algorithm of the choice box. Called the first time the algorithm is chosen, the
+        sizer is then kept with its values.
+        """
         for dropdown_dict in self.dropdown_metadata:
-            sizer = dropdown_dict["sizer_function"]()
-            self.sizer_run.Add(sizer, 0, wx.EXPAND)
-            self.positions[dropdown_dict["name"]] = self.sizer_run.GetItemCount() - 1
+            if dropdown_dict["name"] == selection:
+                sizer = dropdown_dict["sizer_function"]()
+                self.sizer_run.Add(sizer, 0, wx.EXPAND)
+                self.positions[selection] = self.sizer_run.GetItemCount() - 1
 
     def on_choice(self, event):
         # Get the selection from the choice box widget
@@ -64,6 +67,9 @@ class B1ShimTab(Tab):
         else:
             selection = self.choice_box.GetString(self.choice_box.GetSelection())
 
+        if selection not in self.positions.keys():
+            self.create_dropdown_sizer(selection)
+
         # Unshow everything then show the correct item according to the choice box
         self.unshow_choice_box_sizers()
         if selection in self.positions.keys():
@@ -73,8 +79,7 @@ class B1ShimTab(Tab):
             pass
 
         # Update the window
-        self.SetVirtualSize(self.sizer_run.GetMinSize())
-        self.Layout()
+        self.request_layout()
 
     def unshow_choice_box_sizers(self):
         """Set the Show variable to false for all sizers of the choice box widget"""
@@ -9,7 +9,7 @@ from fsleyes_plugin_shimming_toolbox.tabs.tab import Tab
 from fsleyes_plugin_shimming_toolbox.components.input_component import InputComponent
 from fsleyes_plugin_shimming_toolbox.components.run_component import RunComponent
 
-from shimmingtoolbox.cli.dicom_to_nifti import dicom_to_nifti_cli
+dicom_to_nifti_cli = 'shimmingtoolbox.cli.dicom_to_nifti:dicom_to_nifti_cli'
 
 
 class DicomToNiftiTab(Tab):
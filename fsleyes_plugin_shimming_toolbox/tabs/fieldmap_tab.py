@@ -10,7 +10,7 @@ from fsleyes_plugin_shimming_toolbox.components.dropdown_component import Dropdo
 from fsleyes_plugin_shimming_toolbox.components.input_component import InputComponent
 from fsleyes_plugin_shimming_toolbox.components.run_component import RunComponent
 
-from shimmingtoolbox.cli.prepare_fieldmap import prepare_fieldmap_cli
+prepare_fieldmap_cli = 'shimmingtoolbox.cli.prepare_fieldmap:prepare_fieldmap_cli'
 
 
 class FieldMapTab(Tab):
@@ -1,12 +1,11 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*
 
-import os
 import webbrowser
 import wx
 
-from fsleyes_plugin_shimming_toolbox import __DIR_ST_PLUGIN_IMG__
 from fsleyes_plugin_shimming_toolbox.components.input_component import InputComponent
+from fsleyes_plugin_shimming_toolbox.icons import get_bitmap
 
 
 class Tab(wx.ScrolledWindow):
@@ -16,6 +15,30 @@ class Tab(wx.ScrolledWindow):
         self.sizer_info = InfoSection(self, description).sizer
         self.terminal_component = parent.terminal_component
         self.SetScrollbars(1, 4, 1, 1)
+        self.layout_pending = False
+
+    def request_layout(self):
+        """Ask for the tab to be laid out once the current event is handled.
+
+        Showing or hiding widgets in nested dropdowns and checkboxes calls this many times for a single click. The tab
+        is frozen on the first call and is laid out and thawed once, after the event.
+        """
+        if self.layout_pending:
+            return
+        self.layout_pending = True
+        self.Freeze()
+        wx.CallAfter(self.do_layout)
+
+    def do_layout(self):
+        if not self or not self.layout_pending:
+            # The tab was destroyed or it was already laid out
+            return
+        self.layout_pending = False
+        try:
+            self.SetVirtualSize(self.sizer_run.GetMinSize())
+            self.Layout()
+        finally:
+            self.Thaw()
 
     def create_sizer(self):
         """Create the parent sizer for the tab.
@@ -52,16 +75,14 @@ class InfoSection:
         sizer = wx.BoxSizer(wx.VERTICAL)
 
         # Load ShimmingToolbox logo saved as a png image, rescale it, and return it as a wx.Bitmap image.
-        st_logo = wx.Image(os.path.join(__DIR_ST_PLUGIN_IMG__, 'shimming_toolbox_logo.png'), wx.BITMAP_TYPE_PNG)
-        st_logo.Rescale(int(st_logo.GetWidth() * 0.2), int(st_logo.GetHeight() * 0.2), wx.IMAGE_QUALITY_HIGH)
-        st_logo = st_logo.ConvertToBitmap()
+        st_logo = get_bitmap('shimming_toolbox_logo.png', scale=0.2)
         logo = wx.StaticBitmap(parent=self.panel, id=-1, bitmap=st_logo, pos=wx.DefaultPosition)
         width = logo.Size[0]
         sizer.Add(logo, flag=wx.SHAPED, proportion=1)
         sizer.AddSpacer(10)
 
         # Create a "Documentation" button that redirects towards https://shimming-toolbox.org/en/latest/
-        rtd_logo = wx.Bitmap(os.path.join(__DIR_ST_PLUGIN_IMG__, 'RTD.png'), wx.BITMAP_TYPE_PNG)
+        rtd_logo = get_bitmap('RTD.png')
         button_documentation = wx.Button(self.panel, label="Documentation")
         button_documentation.Bind(wx.EVT_BUTTON, self.open_documentation_url)
         button_documentation.SetBitmap(rtd_logo)
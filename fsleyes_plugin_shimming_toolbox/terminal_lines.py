@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*
+
+import collections
+import os
+import tempfile
+
+
+class TerminalLines:
+    """Lines of a terminal, the last ``max_lines`` are kept in memory and older lines are appended to a file.
+
+    Attributes:
+        path_history (str): File the older lines are appended to, one per terminal since several panels can be opened
+                            in the same FSLeyes.
+        n_lines_history (int): Number of lines in ``path_history``.
+    """
+
+    def __init__(self, max_lines):
+        self.lines = collections.deque(maxlen=max(1, max_lines))
+        fd, self.path_history = tempfile.mkstemp(prefix='st_plugin_terminal_', suffix='.log')
+        os.close(fd)
+        self.n_lines_history = 0
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, index):
+        return self.lines[index]
+
+    def extend(self, new_lines):
+        """Append ``new_lines``, the lines that no longer fit are moved to the history file.
+
+        Returns:
+            int: Number of lines that were moved out of memory.
+        """
+        n_spill = len(self.lines) + len(new_lines) - self.lines.maxlen
+        if n_spill > 0:
+            spilled = [self.lines[i] for i in range(min(n_spill, len(self.lines)))]
+            spilled += new_lines[:n_spill - len(spilled)]
+            self.spill(spilled)
+        self.lines.extend(new_lines)
+        return max(n_spill, 0)
+
+    def spill(self, lines):
+        try:
+            with open(self.path_history, 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+        except OSError:
+            # Losing old history is not worth interrupting the user
+            return
+        self.n_lines_history += len(lines)
+
+    def close(self):
+        """Remove the history file."""
+        if os.path.exists(self.path_history):
+            os.remove(self.path_history)
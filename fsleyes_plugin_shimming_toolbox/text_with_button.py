@@ -1,10 +1,10 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*
 
-import os
 import wx
 
-from fsleyes_plugin_shimming_toolbox import __DIR_ST_PLUGIN_IMG__
+from fsleyes_plugin_shimming_toolbox.header_cache import get_header_cache
+from fsleyes_plugin_shimming_toolbox.icons import get_bitmap
 from fsleyes_plugin_shimming_toolbox.select import select_file, select_folder, select_from_overlay
 
 
@@ -96,15 +96,22 @@ class TextWithButton:
         text_with_button_box.Add(button, 0, wx.ALIGN_LEFT | wx.RIGHT, 10)
 
         for textctrl in self.textctrl_list:
+            # Bound last so that it runs first, it skips the event to the handlers above
+            textctrl.Bind(wx.EVT_TEXT, on_text_prefetch_header)
             text_with_button_box.Add(textctrl, 1, wx.ALIGN_LEFT | wx.LEFT, 10)
             if self.required:
-                asterisk_icon = wx.Image(os.path.join(__DIR_ST_PLUGIN_IMG__, 'asterisk.png'),
-                                         wx.BITMAP_TYPE_PNG).ConvertToBitmap()
+                asterisk_icon = get_bitmap('asterisk.png')
                 text_with_button_box.Add(wx.StaticBitmap(self.panel, bitmap=asterisk_icon), 0, wx.RIGHT, 7)
 
         return text_with_button_box
 
 
+def on_text_prefetch_header(event):
+    """Read the header of the NIfTI file entered in a text box in the background."""
+    get_header_cache().prefetch(event.GetString())
+    event.Skip()
+
+
 def on_info_icon_mouse_over(event):
     image = event.GetEventObject()
     image.SetToolTip(wx.ToolTip(image.info_text))
@@ -202,7 +209,7 @@ def add_input_coil_boxes(event, tab, ctrl, i=0):
     elif i == 2:
         tab.n_coils_rt = n_coils
 
-    tab.SetVirtualSize(tab.sizer_run.GetMinSize())
+    tab.request_layout()
 
 
 def add_input_phase_boxes(event, tab, ctrl):
@@ -268,7 +275,7 @@ def add_input_phase_boxes(event, tab, ctrl):
             )
 
     tab.n_echoes = n_echoes
-    tab.SetVirtualSize(tab.sizer_run.GetMinSize())
+    tab.request_layout()
 
 
 class InfoIcon(wx.StaticBitmap):
@@ -278,7 +285,7 @@ class InfoIcon(wx.StaticBitmap):
 
 
 def create_info_icon(panel, info_text=""):
-    info_icon = wx.Image(os.path.join(__DIR_ST_PLUGIN_IMG__, 'info-icon.png'), wx.BITMAP_TYPE_PNG).ConvertToBitmap()
+    info_icon = get_bitmap('info-icon.png')
     image = InfoIcon(panel, bitmap=info_icon, info_text=info_text)
     image.Bind(wx.EVT_MOTION, on_info_icon_mouse_over)
     return image
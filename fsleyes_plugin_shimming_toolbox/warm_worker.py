@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*
+
+import asyncio
+import atexit
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+# Opt-in: set ST_PLUGIN_WARM_WORKER=1 before launching FSLeyes
+USE_WARM_WORKER = os.environ.get('ST_PLUGIN_WARM_WORKER', '0') == '1'
+# Longest message read from the worker
+STREAM_LIMIT = 2 ** 20
+
+_warm_worker = None
+
+
+class WarmWorkerError(Exception):
+    """Exception raised when a job could not be started on the warm worker."""
+    pass
+
+
+class WarmWorker:
+    """Client of the persistent ``shimming-toolbox`` worker process (see ``worker_server.py``).
+
+    The worker runs in the ``shimming-toolbox`` python environment with the ``st_*`` CLIs already imported. Jobs are
+    sent to it over a local socket.
+
+    Attributes:
+        process (subprocess.Popen): Worker process.
+        socket_path (str): Path of the unix socket the worker listens on.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.socket_path = None
+        self._tmp_dir = None
+        atexit.register(self.stop)
+
+    def start(self, python, env=None):
+        """Start the worker process, it becomes ready once it has imported the CLIs.
+
+        Args:
+            python (str): Python executable of the ``shimming-toolbox`` environment.
+            env (dict): Environment of the worker process.
+        """
+        if self.process is not None and self.process.poll() is None:
+            return
+        self._tmp_dir = tempfile.mkdtemp(prefix='st_worker_')
+        self.socket_path = os.path.join(self._tmp_dir, 'worker.sock')
+        self.process = subprocess.Popen(
+            [python, '-m', 'fsleyes_plugin_shimming_toolbox.worker_server', self.socket_path],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=env)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def is_ready(self):
+        return self.process is not None and self.process.poll() is None and os.path.exists(self.socket_path)
+
+    async def run(self, cmd, env=None, cwd=None, cores=None, cpus=None):
+        """Run ``cmd`` on the worker. Must be iterated from an asyncio event loop.
+
+        Args:
+            cmd (list of str): Command to run, ``cmd[0]`` must be a ``st_*`` console script.
+            env (dict): Environment of the job.
+            cwd (str): Working directory of the job.
+            cores (int): Size of the BLAS/OpenMP thread pools of the job.
+            cpus (list of int): CPUs the job is pinned to.
+
+        Yields:
+            dict: Messages from the worker: ``{"pid": int}``, ``{"log": str}`` for each line of output and
+                  ``{"rc": int}`` last.
+
+        Raises:
+            WarmWorkerError: If the job could not be started, the caller can fall back to a new process.
+        """
+        if not self.is_ready():
+            raise WarmWorkerError("The warm worker is not ready")
+
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=STREAM_LIMIT)
+        except OSError as err:
+            raise WarmWorkerError(f"Could not connect to the warm worker: {err}")
+
+        try:
+            writer.write(encode_request(cmd, env, cwd, cores, cpus))
+            await writer.drain()
+            started = False
+            async for line in reader:
+                message = json.loads(line)
+                if 'error' in message:
+                    raise WarmWorkerError(message['error'])
+                started = True
+                yield message
+                if 'rc' in message:
+                    return
+        finally:
+            writer.close()
+
+        if not started:
+            raise WarmWorkerError("The warm worker closed the connection")
+        raise ConnectionError("Lost connection to the warm worker")
+
+
+def encode_request(cmd, env=None, cwd=None, cores=None, cpus=None):
+    request = {'cmd': cmd, 'env': dict(os.environ) if env is None else env, 'cwd': cwd or os.getcwd(),
+               'cores': cores, 'cpus': cpus or []}
+    return (json.dumps(request) + '\n').encode()
+
+
+def get_warm_worker():
+    """Returns the plugin-wide warm worker, None if it is disabled."""
+    return _warm_worker
+
+
+def start_warm_worker(python, env=None):
+    """Start the plugin-wide warm worker if ``USE_WARM_WORKER`` is set. Does nothing if it is already started."""
+    global _warm_worker
+    if not USE_WARM_WORKER:
+        return None
+    if _warm_worker is None:
+        _warm_worker = WarmWorker()
+    _warm_worker.start(python, env=env)
+    return _warm_worker
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*
+
+"""Persistent ``shimming-toolbox`` worker
+
+Started by the plugin with ``python -m fsleyes_plugin_shimming_toolbox.worker_server <socket_path>`` inside the
+``shimming-toolbox`` environment. The ``st_*`` console scripts are imported once at startup. Each request received on
+the local socket is then run in a forked child, which inherits the already imported modules instead of paying for a
+fresh interpreter.
+
+Protocol (one connection per job, one JSON object per line):
+
+- request: ``{"cmd": ["st_mask", "box", ...], "env": {...}, "cwd": "...", "cores": int, "cpus": [int, ...]}``
+- replies: ``{"pid": int}``, then ``{"log": str}`` for each line of output, then
+  ``{"rc": int, "rusage": {"user_time": float, "system_time": float, "max_rss": int}}``. If the command
+  cannot be run by the worker, ``{"error": str}`` is sent instead and the connection is closed.
+
+Do not import wx or the plugin GUI from this module, it does not run inside FSLeyes.
+"""
+
+import json
+import os
+import socketserver
+import sys
+import traceback
+from importlib.metadata import entry_points
+
+try:
+    # numpy/scipy are already imported here, so their thread pools ignore OMP_NUM_THREADS & co.
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+
+def load_console_scripts():
+    """Import the ``st_*`` console scripts provided by ``shimmingtoolbox``.
+
+    Returns:
+        dict: Name of the console script (ex: ``st_b0shim``) mapped to its click command.
+    """
+    scripts = {}
+    for entry_point in entry_points(group='console_scripts'):
+        if entry_point.name.startswith('st_') and entry_point.value.startswith('shimmingtoolbox'):
+            try:
+                scripts[entry_point.name] = entry_point.load()
+            except Exception as err:
+                print(f"Could not import {entry_point.name}: {err}", file=sys.stderr)
+    return scripts
+
+
+def limit_resources(cores, cpus):
+    """Pin the current process to ``cpus`` and limit its BLAS/OpenMP thread pools to ``cores`` threads.
+
+    The pools were started when numpy was imported by the worker, so the ``OMP_NUM_THREADS`` & co. variables of the
+    job don't apply to them, only ``threadpoolctl`` can resize them.
+
+    Returns:
+        str: Description of the limits that were actually applied.
+    """
+    if not cores:
+        policy = "uses the default thread pools"
+    elif threadpool_limits is not None:
+        threadpool_limits(limits=cores)
+        policy = f"uses {cores} thread(s)"
+    else:
+        policy = "uses the default thread pools, threadpoolctl is not installed in the warm worker"
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+        policy += f" pinned to CPU(s) {','.join(str(cpu) for cpu in sorted(cpus))}"
+    return policy
+
+
+def run_child(main, cmd, env, cwd, fd_out, fd_ready, cores=None, cpus=None):
+    """Run ``cmd`` in the forked child process, ``fd_ready`` is closed once it runs in its own session. Never
+    returns."""
+    code = 1
+    try:
+        # New process group so that the job and its own children can be signaled together
+        os.setsid()
+        os.close(fd_ready)
+        os.dup2(fd_out, 1)
+        os.dup2(fd_out, 2)
+        os.close(fd_out)
+        sys.stdout = os.fdopen(1, 'w', buffering=1)
+        sys.stderr = os.fdopen(2, 'w', buffering=1)
+
+        os.environ.clear()
+        os.environ.update(env)
+        if cwd:
+            os.chdir(cwd)
+        print(f"{cmd[0]} {limit_resources(cores, cpus)}")
+
+        main(args=cmd[1:], prog_name=cmd[0])
+        code = 0
+    except SystemExit as err:
+        # click exits with SystemExit in standalone mode
+        if err.code is None:
+            code = 0
+        elif isinstance(err.code, int):
+            code = err.code
+        else:
+            print(err.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Run one job per connection and stream back its output."""
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + '\n').encode())
+        self.wfile.flush()
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        cmd = request['cmd']
+        main = self.server.scripts.get(cmd[0])
+        if main is None:
+            self.send({'error': f"{cmd[0]} is not available in the worker"})
+            return
+
+        fd_read, fd_write = os.pipe()
+        fd_ready_read, fd_ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(fd_read)
+            os.close(fd_ready_read)
+            run_child(main, cmd, request.get('env', dict(os.environ)), request.get('cwd'), fd_write, fd_ready_write,
+                      cores=request.get('cores'), cpus=request.get('cpus'))
+
+        os.close(fd_write)
+        os.close(fd_ready_write)
+        # The pid is only sent once the child leads its own process group, a cancel signals the whole group right away
+        os.read(fd_ready_read, 1)
+        os.close(fd_ready_read)
+        self.send({'pid': pid})
+        with os.fdopen(fd_read, 'r', errors='replace') as stream:
+            for line in stream:
+                self.send({'log': line.rstrip('\n')})
+
+        _, status, rusage = os.wait4(pid, 0)
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        max_rss = rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+        self.send({'rc': os.waitstatus_to_exitcode(status),
+                   'rusage': {'user_time': rusage.ru_utime, 'system_time': rusage.ru_stime, 'max_rss': max_rss}})
+
+
+class WorkerServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Local socket server, each connection is handled in a forked process."""
+
+    def __init__(self, socket_path, scripts):
+        self.scripts = scripts
+        self.parent_pid = os.getppid()
+        super().__init__(socket_path, RequestHandler)
+
+    def service_actions(self):
+        super().service_actions()
+        # Exit if FSLeyes went away without stopping us
+        if os.getppid() != self.parent_pid:
+            raise SystemExit(0)
+
+
+def main(socket_path):
+    # Import everything before binding the socket: the plugin considers the worker ready once the socket exists
+    scripts = load_console_scripts()
+    server = WorkerServer(socket_path, scripts)
+    try:
+        server.serve_forever(poll_interval=1)
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
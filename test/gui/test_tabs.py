@@ -5,6 +5,8 @@ import wx
 
 from .. import realYield, run_with_orthopanel
 from fsleyes_plugin_shimming_toolbox.st_plugin import STControlPanel, NotebookTerminal
+from fsleyes_plugin_shimming_toolbox.tabs.b0shim_tab import B0ShimTab
+from fsleyes_plugin_shimming_toolbox.tabs.fieldmap_tab import FieldMapTab
 
 
 def test_st_plugin_loads():
@@ -27,6 +29,67 @@ def _test_st_plugin_tabs_exist(view, overlayList, displayCtx):
     assert len(tabs) > 0
 
 
+def test_st_plugin_tabs_are_built_on_selection():
+    run_with_orthopanel(_test_st_plugin_tabs_are_built_on_selection)
+
+
+def _test_st_plugin_tabs_are_built_on_selection(view, overlayList, displayCtx):
+    nb_terminal = get_notebook(view)
+
+    # Only the default tab is built when the panel opens
+    assert get_tab(nb_terminal, B0ShimTab) is not None
+    assert get_tab(nb_terminal, FieldMapTab) is None
+
+    assert set_notebook_page(nb_terminal, 'Fieldmap')
+    fmap_tab = get_tab(nb_terminal, FieldMapTab)
+    assert fmap_tab is not None
+    assert nb_terminal.GetCurrentPage() is fmap_tab
+    assert nb_terminal.GetPageCount() == 5
+
+
+def test_st_plugin_algorithms_are_built_on_choice():
+    run_with_orthopanel(_test_st_plugin_algorithms_are_built_on_choice)
+
+
+def _test_st_plugin_algorithms_are_built_on_choice(view, overlayList, displayCtx):
+    nb_terminal = get_notebook(view)
+    b0shim_tab = get_tab(nb_terminal, B0ShimTab)
+
+    # Only the default algorithm is built with the tab
+    assert list(b0shim_tab.positions.keys()) == ['Dynamic/volume']
+    assert b0shim_tab.run_component_rt is None
+
+    assert set_dropdown_selection(b0shim_tab.choice_box, 'Realtime Dynamic')
+    assert b0shim_tab.run_component_rt is not None
+
+    # Going back keeps the sizer that was already built
+    run_component_dyn = b0shim_tab.run_component_dyn
+    assert set_dropdown_selection(b0shim_tab.choice_box, 'Dynamic/volume')
+    assert b0shim_tab.run_component_dyn is run_component_dyn
+
+
+def test_st_plugin_nested_dropdowns_are_resolved_from_the_root():
+    run_with_orthopanel(_test_st_plugin_nested_dropdowns_are_resolved_from_the_root)
+
+
+def _test_st_plugin_nested_dropdowns_are_resolved_from_the_root(view, overlayList, displayCtx):
+    nb_terminal = get_notebook(view)
+    b0shim_tab = get_tab(nb_terminal, B0ShimTab)
+    dropdown_opt = b0shim_tab.dropdown_opt_dyn
+    dropdown_crit = dropdown_opt.dropdown_children[0]
+
+    assert dropdown_crit.dropdown_parent is dropdown_opt
+    assert dropdown_crit.get_root() is dropdown_opt
+
+    # Changing the nested dropdown updates the options of its parent
+    assert set_dropdown_selection(dropdown_crit.choice_box, 'Mean Absolute Error')
+    assert dropdown_opt.input_text_boxes['optimizer-criteria'] == ['mae']
+
+    # The options of a nested dropdown that is not selected are dropped
+    assert set_dropdown_selection(dropdown_opt.choice_box, 'Pseudo Inverse')
+    assert 'optimizer-criteria' not in dropdown_opt.input_text_boxes
+
+
 def get_notebook(view):
     """ Returns the notebook terminal from the ST plugin."""
 
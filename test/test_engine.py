@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import pytest
+import sys
+import time
+from unittest import mock
+
+from fsleyes_plugin_shimming_toolbox.engine import SubprocessEngine, LOG_FLUSH_INTERVAL
+from fsleyes_plugin_shimming_toolbox.events import STATUS_CANCELLED, STATUS_TIMED_OUT
+from fsleyes_plugin_shimming_toolbox.scheduler import Job
+
+
+@mock.patch('fsleyes_plugin_shimming_toolbox.engine.post_log')
+def test_engine_batches_log_lines(post_log):
+    engine = SubprocessEngine()
+    engine.start()
+    job = mock.Mock()
+
+    for i in range(100):
+        engine.loop.call_soon_threadsafe(engine.log, job, f"line {i}")
+    time.sleep(LOG_FLUSH_INTERVAL * 5)
+
+    post_log.assert_called_once_with(job, '\n'.join(f"line {i}" for i in range(100)))
+    assert engine.pending_logs == {}
+    engine.loop.call_soon_threadsafe(engine.loop.stop)
+
+
+@pytest.fixture
+def engine():
+    engine = SubprocessEngine()
+    engine.start()
+    with mock.patch('fsleyes_plugin_shimming_toolbox.engine.get_dispatcher'), \
+            mock.patch('fsleyes_plugin_shimming_toolbox.engine.get_warm_worker', return_value=None), \
+            mock.patch('fsleyes_plugin_shimming_toolbox.engine.post_log'), \
+            mock.patch('wx.PostEvent') as post_event:
+        engine.post_event = post_event
+        yield engine
+    engine.loop.call_soon_threadsafe(engine.loop.stop)
+
+
+def run(engine, cmd, timeout=None):
+    """Submit ``cmd`` to ``engine``, returns the job and the future of its run."""
+    job = Job(cmd, 'st_test', cores=1, timeout=timeout)
+    # The scheduler marks the job as running before submitting it
+    job.status = 'running'
+    return job, engine.submit(job)
+
+
+def get_result(engine, future):
+    future.result(timeout=20)
+    return engine.post_event.call_args.args[1]
+
+
+def wait_for_pid(fname):
+    """Returns the pid written in ``fname`` by the job."""
+    for _ in range(200):
+        if os.path.isfile(fname) and open(fname).read().strip():
+            return int(open(fname).read())
+        time.sleep(0.05)
+    raise TimeoutError(f"{fname} was not written")
+
+
+def is_alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Zombies are dead, they are only waiting to be reaped by init
+            return f.read().rsplit(')', 1)[1].split()[0] not in 'ZX'
+    except FileNotFoundError:
+        return False
+
+
+def wait_until_dead(pid):
+    for _ in range(100):
+        if not is_alive(pid):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Reads the state of the processes from /proc")
+def test_engine_cancel_kills_the_process_group(engine, tmp_path):
+    fname_pid = os.path.join(tmp_path, 'pid')
+    job, future = run(engine, ['sh', '-c', f'sleep 60 & echo $! > {fname_pid}; wait'])
+    grandchild = wait_for_pid(fname_pid)
+
+    engine.cancel(job)
+    evt = get_result(engine, future)
+
+    assert evt.get_status() == STATUS_CANCELLED
+    assert evt.get_data() == -15
+    assert wait_until_dead(grandchild)
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Reads the state of the processes from /proc")
+def test_engine_kills_jobs_that_ignore_sigterm(engine, tmp_path):
+    fname_pid = os.path.join(tmp_path, 'pid')
+    job, future = run(engine, ['sh', '-c', f'trap "" TERM; sleep 60 & echo $! > {fname_pid}; wait'])
+    grandchild = wait_for_pid(fname_pid)
+
+    with mock.patch('fsleyes_plugin_shimming_toolbox.engine.KILL_GRACE', 0.2):
+        engine.cancel(job)
+        evt = get_result(engine, future)
+
+    assert evt.get_status() == STATUS_CANCELLED
+    assert evt.get_data() == -9
+    assert wait_until_dead(grandchild)
+
+
+def test_engine_times_out(engine):
+    job, future = run(engine, ['sleep', '60'], timeout=0.2)
+    evt = get_result(engine, future)
+
+    assert evt.get_status() == STATUS_TIMED_OUT
+    assert evt.get_data() == -15
+
+
+def test_engine_reports_resource_usage(engine):
+    job, future = run(engine, [sys.executable, '-c', 'x = bytearray(64 * 2 ** 20); sum(range(10 ** 6))'])
+    evt = get_result(engine, future)
+
+    assert evt.get_data() == 0
+    assert evt.get_status() is None
+    usage = evt.get_resource_usage()
+    assert usage is job.resource_usage
+    assert usage.max_rss >= 64 * 2 ** 20
+    assert usage.user_time > 0
+    assert usage.wall_time > 0
@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from unittest import mock
+
+from fsleyes_plugin_shimming_toolbox.events import JobEventDispatcher, LogEvent, log_event_type
+from fsleyes_plugin_shimming_toolbox.events import ResultEvent, result_event_type
+from fsleyes_plugin_shimming_toolbox.scheduler import Job
+
+
+def log_event(job, msg):
+    event = LogEvent(log_event_type, -1, job.name, job_id=job.id)
+    event.set_data(msg)
+    return event
+
+
+def result_event(job, rc):
+    event = ResultEvent(result_event_type, -1, job.name, job_id=job.id)
+    event.set_data(rc)
+    return event
+
+
+def test_dispatcher_routes_events_to_the_component_of_the_job():
+    dispatcher = JobEventDispatcher()
+    # Two tabs run the same st_function at the same time
+    components = [mock.MagicMock(), mock.MagicMock()]
+    jobs = [Job(['st_mask', 'box'], 'st_mask box') for _ in components]
+    for job, component in zip(jobs, components):
+        dispatcher.register(job.id, component)
+
+    dispatcher.on_log(log_event(jobs[1], "second"))
+    dispatcher.on_log(log_event(jobs[0], "first"))
+    dispatcher.on_result(result_event(jobs[0], 0))
+
+    assert [call.args[0].get_data() for call in components[0].log.call_args_list] == ["first"]
+    assert [call.args[0].get_data() for call in components[1].log.call_args_list] == ["second"]
+    assert components[0].on_result.call_args.args[0].get_data() == 0
+    components[1].on_result.assert_not_called()
+
+    # The job is unregistered once it has a result, its late events and the events of unknown jobs are dropped
+    dispatcher.on_log(log_event(jobs[0], "late"))
+    dispatcher.on_result(result_event(jobs[0], 1))
+    dispatcher.unregister(jobs[1].id)
+    dispatcher.on_log(log_event(jobs[1], "cancelled"))
+    unknown = Job(['st_mask', 'box'], 'st_mask box')
+    dispatcher.on_log(log_event(unknown, "unknown"))
+    dispatcher.on_result(result_event(unknown, 0))
+    assert components[0].log.call_count == 1
+    assert components[0].on_result.call_count == 1
+    assert components[1].log.call_count == 1
+    components[1].on_result.assert_not_called()
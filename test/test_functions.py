@@ -1,10 +1,42 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import click
+import os
+
+from fsleyes_plugin_shimming_toolbox.components import help_index
 from fsleyes_plugin_shimming_toolbox.components.component import get_help_text
+from fsleyes_plugin_shimming_toolbox.components.help_index import HelpIndex, index_cli
 from shimmingtoolbox.cli.b0shim import dynamic
 
 
 def test_get_help_text():
     help_text = get_help_text(dynamic, 'o')
     assert "Directory to output coil text file(s)." == help_text
+
+
+def test_get_help_text_from_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(help_index, '_index', HelpIndex(os.path.join(tmp_path, 'help_index.json')))
+    help_text = get_help_text('shimmingtoolbox.cli.b0shim:dynamic', 'o')
+    assert get_help_text(dynamic, 'o') == help_text
+    assert get_help_text('shimmingtoolbox.cli.b0shim:dynamic', 'output') == help_text
+
+
+def test_help_index_is_persisted_per_version(tmp_path):
+    path = os.path.join(tmp_path, 'help_index.json')
+    HelpIndex(path, st_version='1.0').get('shimmingtoolbox.cli.b0shim:dynamic', 'fmap')
+
+    assert 'shimmingtoolbox.cli.b0shim:dynamic' in HelpIndex(path, st_version='1.0').clis
+    assert HelpIndex(path, st_version='1.1').clis == {}
+
+
+def test_index_cli_with_positional_argument():
+    @click.command()
+    @click.argument('phase', nargs=-1)
+    @click.option('-o', '--output', help="Output filename for the fieldmap.")
+    def prepare(phase, output):
+        pass
+
+    entries = index_cli(prepare)
+    assert entries['o'] == entries['output'] == "Output filename for the fieldmap."
+    assert entries['phase'] is None
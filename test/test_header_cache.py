@@ -0,0 +1,36 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import json
+import nibabel as nib
+import numpy as np
+import os
+
+from fsleyes_plugin_shimming_toolbox.header_cache import get_sidecar_path, HeaderCache
+
+
+def test_header_cache_invalidates_on_change(tmp_path):
+    fname = os.path.join(tmp_path, 'fieldmap.nii.gz')
+    nib.save(nib.Nifti1Image(np.zeros([2, 3, 4], dtype=np.int16), np.eye(4)), fname)
+    with open(get_sidecar_path(fname), 'w') as f:
+        json.dump({'EchoTime': 0.0025}, f)
+
+    cache = HeaderCache()
+    header = cache.get(fname)
+    assert header.shape == (2, 3, 4)
+    assert header.dtype == np.int16
+    assert header.memory_dtype == np.int16
+    assert header.sidecar['EchoTime'] == 0.0025
+    assert cache.get(fname) is header
+
+    nib.save(nib.Nifti1Image(np.zeros([5, 5, 5, 2], dtype=np.float32), np.eye(4)), fname)
+    os.utime(fname, ns=(0, header.stat[1] + 1))
+    assert cache.get(fname).shape == (5, 5, 5, 2)
+
+
+def test_header_cache_ignores_other_files(tmp_path):
+    fname = os.path.join(tmp_path, 'coil.json')
+    with open(fname, 'w') as f:
+        f.write("{}")
+    assert HeaderCache().get(fname) is None
+    assert get_sidecar_path('/data/sub-01_phase1.nii') == '/data/sub-01_phase1.json'
@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import fsl.data.image as fslimage
+import gc
+import nibabel as nib
+import numpy as np
+import os
+from unittest import mock
+
+from fsleyes_plugin_shimming_toolbox.overlay_loader import get_data_size, get_memory_size, OverlayLoader, read_nifti
+from fsleyes_plugin_shimming_toolbox.overlay_loader import evict_uncompressed, uncompress
+
+
+class FakeImage:
+    def __init__(self, path):
+        self.name = path
+        self.shape = (64, 64, 64)
+        self.dtype = np.dtype(np.float32)
+
+
+class FakeProperties:
+    """Display or display options of an overlay"""
+    def __init__(self, **properties):
+        self.__dict__.update(properties)
+
+    def getAllProperties(self):
+        return list(self.__dict__), []
+
+
+class FakeDisplayContext:
+    def __init__(self):
+        self.displays = {}
+        self.opts = {}
+        self.selected = None
+
+    def getDisplay(self, overlay):
+        return self.displays.setdefault(overlay, FakeProperties(name=overlay.name, overlayType='volume', alpha=100))
+
+    def getOpts(self, overlay):
+        return self.opts.setdefault(overlay, FakeProperties(cmap='greyscale', displayRange=(0, 1)))
+
+    def getSelectedOverlay(self):
+        return self.selected
+
+    def selectOverlay(self, overlay):
+        self.selected = overlay
+
+    def addListener(self, *args):
+        pass
+
+
+def read_or_fail(path):
+    if path == 'broken.nii.gz':
+        raise OSError("truncated file")
+    return FakeImage(path)
+
+
+def test_overlay_loader_appends_overlays_in_order():
+    window = mock.MagicMock()
+    window.overlayList = []
+    terminal = mock.MagicMock()
+    loader = OverlayLoader()
+
+    with mock.patch('wx.CallAfter', side_effect=lambda func, *args: func(*args)):
+        loader.load(window, [('fmap.nii.gz', read_or_fail, None),
+                             ('broken.nii.gz', read_or_fail, None),
+                             ('mask.png', read_or_fail, 'greyscale')], terminal)
+        loader._executor.shutdown(wait=True)
+
+    assert [image.name for image in window.overlayList] == ['fmap.nii.gz', 'mask.png']
+    assert window.displayCtx.getOpts.return_value.cmap == 'greyscale'
+    messages = [call.args[0] for call in terminal.log_to_terminal.call_args_list]
+    assert messages[0] == "Loading 3 output(s) in the background"
+    assert "Could not load broken.nii.gz: truncated file" in messages
+    assert messages[-1] == "Loaded mask.png (3/3)"
+
+
+def test_overlay_loader_replaces_overlays_of_previous_runs():
+    window = mock.MagicMock()
+    user_overlay = FakeImage('anat.nii.gz')
+    window.overlayList = [user_overlay]
+    terminal = mock.MagicMock()
+    loader = OverlayLoader()
+
+    with mock.patch('wx.CallAfter', side_effect=lambda func, *args: func(*args)):
+        loader.load(window, [('fmap.nii.gz', read_or_fail, None)], terminal)
+        loader.load(window, [('fmap.nii.gz', read_or_fail, None)], terminal)
+        loader._executor.shutdown(wait=True)
+
+    assert len(window.overlayList) == 2
+    assert window.overlayList[0] is user_overlay
+    assert loader.find_overlay(window.overlayList, 'fmap.nii.gz') is window.overlayList[1]
+    assert terminal.log_to_terminal.call_args_list[-1].args[0] == "Reloaded fmap.nii.gz (1/1)"
+
+
+def test_overlay_loader_keeps_display_settings_of_repeated_runs():
+    window = mock.MagicMock()
+    window.overlayList = [FakeImage('anat.nii.gz')]
+    window.displayCtx = FakeDisplayContext()
+    loader = OverlayLoader()
+
+    with mock.patch('wx.CallAfter', side_effect=lambda func, *args: func(*args)):
+        loader.load(window, [('fmap.nii.gz', read_or_fail, None)], mock.MagicMock())
+        loader._executor.shutdown(wait=True)
+        first = window.overlayList[1]
+        window.displayCtx.getDisplay(first).alpha = 40
+        window.displayCtx.getOpts(first).cmap = 'hot'
+        window.displayCtx.getOpts(first).displayRange = (-100, 100)
+        window.displayCtx.selectOverlay(first)
+
+        for _ in range(3):
+            loader._executor = None
+            loader.load(window, [('fmap.nii.gz', read_or_fail, None)], mock.MagicMock())
+            loader._executor.shutdown(wait=True)
+
+    assert [image.name for image in window.overlayList] == ['anat.nii.gz', 'fmap.nii.gz']
+    last = window.overlayList[1]
+    assert last is not first
+    assert window.displayCtx.getDisplay(last).alpha == 40
+    assert window.displayCtx.getOpts(last).cmap == 'hot'
+    assert window.displayCtx.getOpts(last).displayRange == (-100, 100)
+    assert window.displayCtx.getSelectedOverlay() is last
+
+
+def test_overlay_loader_does_not_replace_overlays_of_the_user():
+    window = mock.MagicMock()
+    user_overlay = FakeImage('fmap.nii.gz')
+    user_overlay.dataSource = os.path.abspath('fmap.nii.gz')
+    window.overlayList = [user_overlay]
+    loader = OverlayLoader()
+
+    with mock.patch('wx.CallAfter', side_effect=lambda func, *args: func(*args)):
+        loader.load(window, [('fmap.nii.gz', read_or_fail, None)], mock.MagicMock())
+        loader._executor.shutdown(wait=True)
+
+    assert len(window.overlayList) == 2
+    assert window.overlayList[0] is user_overlay
+
+
+def test_read_nifti_maps_large_outputs(tmp_path):
+    fname = os.path.join(tmp_path, 'fieldmap.nii.gz')
+    data = np.arange(8 * 8 * 8, dtype=np.float32).reshape([8, 8, 8])
+    nib.save(nib.Nifti1Image(data, np.eye(4)), fname)
+    folder = os.path.join(tmp_path, 'uncompressed')
+
+    # 2 kB of voxel data is memory-mapped from an uncompressed copy
+    with mock.patch('fsleyes_plugin_shimming_toolbox.overlay_loader.UNCOMPRESSED_DIR', folder):
+        image = read_nifti(fname, inmem_max_mb=0.001)
+    assert not image.inMemory
+    assert image.name == 'fieldmap'
+    assert os.listdir(folder) == [os.path.basename(image.dataSource)]
+
+    # The copy is read each time the data is accessed, it is kept as long as the image is alive
+    evict_uncompressed(folder, 0)
+    nib.save(nib.Nifti1Image(data + 1, np.eye(4)), fname)
+    uncompress(fname, folder)
+    assert len(os.listdir(folder)) == 2
+    assert np.array_equal(image[..., 1], data[..., 1])
+
+    fname_copy = image.dataSource
+    del image
+    gc.collect()
+    evict_uncompressed(folder, 0)
+    assert not os.path.exists(fname_copy)
+
+
+def test_read_nifti_reads_small_outputs_in_memory(tmp_path):
+    fname = os.path.join(tmp_path, 'mask.nii.gz')
+    nib.save(nib.Nifti1Image(np.ones([4, 4, 4], dtype=np.uint8), np.eye(4)), fname)
+    with open(os.path.join(tmp_path, 'mask.json'), 'w') as f:
+        f.write('{"EchoTime": 0.005}')
+
+    image = read_nifti(fname)
+    assert image.inMemory
+    assert image.getMeta('EchoTime') == 0.005
+
+
+def test_memory_size_follows_how_the_image_was_read(tmp_path):
+    fname = os.path.join(tmp_path, 'fieldmap.nii.gz')
+    nib.save(nib.Nifti1Image(np.zeros([8, 8, 8], dtype=np.float32), np.eye(4)), fname)
+
+    assert get_memory_size(read_nifti(fname)) == 8 * 8 * 8 * 4
+    with mock.patch('fsleyes_plugin_shimming_toolbox.overlay_loader.UNCOMPRESSED_DIR', os.path.join(tmp_path, 'tmp')):
+        image_mapped = read_nifti(fname, inmem_max_mb=0)
+    assert get_memory_size(image_mapped) == 0
+    # Accessing all of its data reads it in memory
+    image_mapped.data
+    assert get_memory_size(image_mapped) == 8 * 8 * 8 * 4
+    # The NIfTI conversions of the PNG outputs are in memory before their data is accessed
+    assert get_memory_size(fslimage.Image(np.zeros([8, 8, 1], dtype=np.uint8))) == 8 * 8
+
+
+def test_scaled_data_is_counted_as_floats(tmp_path):
+    fname = os.path.join(tmp_path, 'phase.nii.gz')
+    nii = nib.Nifti1Image(np.zeros([8, 8, 8], dtype=np.int16), np.eye(4))
+    nii.header.set_slope_inter(2.0, 1.0)
+    nib.save(nii, fname)
+
+    assert get_data_size(fname) == 8 * 8 * 8 * 8
+    assert get_memory_size(read_nifti(fname)) == 8 * 8 * 8 * 8
+
+
+def test_uncompress_keeps_the_latest_copy(tmp_path):
+    fname = os.path.join(tmp_path, 'fieldmap.nii.gz')
+    folder = os.path.join(tmp_path, 'uncompressed')
+    nib.save(nib.Nifti1Image(np.zeros([2, 3, 4], dtype=np.int16), np.eye(4)), fname)
+
+    fname_nii = uncompress(fname, folder)
+    assert nib.load(fname_nii).shape == (2, 3, 4)
+    assert uncompress(fname, folder) == fname_nii
+
+    nib.save(nib.Nifti1Image(np.zeros([5, 5, 5], dtype=np.int16), np.eye(4)), fname)
+    os.utime(fname, ns=(0, os.stat(fname_nii).st_mtime_ns + 1))
+    fname_new = uncompress(fname, folder)
+    assert nib.load(fname_new).shape == (5, 5, 5)
+    assert os.listdir(folder) == [os.path.basename(fname_new)]
+
+
+def test_uncompress_evicts_least_recently_used_copies(tmp_path):
+    folder = os.path.join(tmp_path, 'uncompressed')
+    fnames = [os.path.join(tmp_path, f"fieldmap{index}.nii.gz") for index in range(3)]
+    for fname in fnames:
+        nib.save(nib.Nifti1Image(np.zeros([10, 10, 10], dtype=np.int16), np.eye(4)), fname)
+
+    # Each copy takes a bit more than 2000 bytes
+    copy_0 = uncompress(fnames[0], folder, max_bytes=5000)
+    copy_1 = uncompress(fnames[1], folder, max_bytes=5000)
+    os.utime(copy_1, (0, 0))
+    uncompress(fnames[0], folder, max_bytes=5000)
+    copy_2 = uncompress(fnames[2], folder, max_bytes=5000)
+
+    assert sorted(os.listdir(folder)) == sorted([os.path.basename(copy_0), os.path.basename(copy_2)])
+
+
+def test_overlay_loader_unloads_least_recently_selected_outputs():
+    window = mock.MagicMock()
+    user_overlay = FakeImage('anat.nii.gz')
+    window.overlayList = [user_overlay]
+    window.displayCtx.getSelectedOverlay.return_value = user_overlay
+    loader = OverlayLoader(budget_mb=2.5)
+
+    # Each output takes 1 MB in memory
+    with mock.patch('wx.CallAfter', side_effect=lambda func, *args: func(*args)):
+        loader.load(window, [('a.png', read_or_fail, None), ('b.png', read_or_fail, None)], mock.MagicMock())
+        loader._executor.shutdown(wait=True)
+        image_a = loader.find_overlay(window.overlayList, 'a.png')
+        window.displayCtx.getSelectedOverlay.return_value = image_a
+        loader.on_selected_overlay(1, True, window.displayCtx, 'selectedOverlay')
+
+        loader._executor = None
+        loader.load(window, [('c.png', read_or_fail, None)], mock.MagicMock())
+        loader._executor.shutdown(wait=True)
+
+    # b.png was selected the least recently, the overlay of the user is not part of the budget
+    assert [image.name for image in window.overlayList] == ['anat.nii.gz', 'a.png', 'c.png']
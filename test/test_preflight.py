@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import json
+import nibabel as nib
+import numpy as np
+import os
+import pytest
+
+from fsleyes_plugin_shimming_toolbox.components.component import RunArgumentErrorST
+from fsleyes_plugin_shimming_toolbox.preflight import parse_command, preflight
+
+
+def save_nifti(path, shape, translation=(0, 0, 0), sidecar=None):
+    affine = np.eye(4)
+    affine[:3, 3] = translation
+    nib.save(nib.Nifti1Image(np.zeros(shape, dtype=np.float32), affine), path)
+    if sidecar is not None:
+        with open(path.replace('.nii.gz', '.json'), 'w') as f:
+            json.dump(sidecar, f)
+    return path
+
+
+def test_parse_command():
+    args, options = parse_command(['st_prepare_fieldmap', 'phase1.nii', 'phase2.nii', '--mag', 'mag.nii',
+                                   '--coil', 'coil1.nii', 'coil1.json', '--coil', 'coil2.nii', 'coil2.json'])
+    assert args == ['phase1.nii', 'phase2.nii']
+    assert options == {'mag': [['mag.nii']], 'coil': [['coil1.nii', 'coil1.json'], ['coil2.nii', 'coil2.json']]}
+
+
+def test_preflight_b0shim_dynamic(tmp_path):
+    fmap = save_nifti(os.path.join(tmp_path, 'fmap.nii.gz'), [10, 10, 5])
+    anat = save_nifti(os.path.join(tmp_path, 'anat.nii.gz'), [10, 10, 5], translation=(2, 2, 0))
+    command = ['st_b0shim', 'dynamic', '--fmap', fmap, '--anat', anat, '--output', str(tmp_path)]
+    preflight('st_b0shim dynamic', command)
+
+    # Realtime needs a 4D fieldmap
+    with pytest.raises(RunArgumentErrorST, match="fmap must be 4D"):
+        preflight('st_b0shim realtime-dynamic', command)
+
+    far_anat = save_nifti(os.path.join(tmp_path, 'far_anat.nii.gz'), [10, 10, 5], translation=(100, 0, 0))
+    with pytest.raises(RunArgumentErrorST, match="does not overlap"):
+        preflight('st_b0shim dynamic', ['st_b0shim', 'dynamic', '--fmap', fmap, '--anat', far_anat])
+
+    # A coil is a 4D stack of channel fieldmaps, it passes the shape check and fails on its constraint file
+    coil = save_nifti(os.path.join(tmp_path, 'coil.nii.gz'), [10, 10, 5, 8])
+    with pytest.raises(RunArgumentErrorST, match="does not exist"):
+        preflight('st_b0shim dynamic', command + ['--coil', coil, os.path.join(tmp_path, 'missing.json')])
+
+
+def test_preflight_prepare_fieldmap_echo_times(tmp_path):
+    phase1 = save_nifti(os.path.join(tmp_path, 'phase1.nii.gz'), [4, 4, 4], sidecar={'EchoTime': 0.002})
+    phase2 = save_nifti(os.path.join(tmp_path, 'phase2.nii.gz'), [4, 4, 4], sidecar={'EchoTime': 0.002})
+    mag = save_nifti(os.path.join(tmp_path, 'mag.nii.gz'), [4, 4, 4])
+
+    with pytest.raises(RunArgumentErrorST, match="different echoes"):
+        preflight('st_prepare_fieldmap', ['st_prepare_fieldmap', phase1, phase2, '--mag', mag])
+    preflight('st_prepare_fieldmap', ['st_prepare_fieldmap', phase1, '--mag', mag])
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+
+from fsleyes_plugin_shimming_toolbox.result_cache import changed_files, ResultCache, snapshot
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_key_ignores_output_folder_and_follows_input_content(tmp_path):
+    fname_input = os.path.join(tmp_path, 'input.nii')
+    write(fname_input, "a")
+    cache = ResultCache(os.path.join(tmp_path, 'cache'))
+
+    key = cache.make_key(
+        ['st_mask', 'box', '--input', fname_input, '--output', os.path.join(tmp_path, 'out1', 'mask.nii')],
+        os.path.join(tmp_path, 'out1', 'mask.nii'))
+    key_other_output = cache.make_key(
+        ['st_mask', 'box', '--input', fname_input, '--output', os.path.join(tmp_path, 'out2', 'mask.nii')],
+        os.path.join(tmp_path, 'out2', 'mask.nii'))
+    assert key == key_other_output
+
+    write(fname_input, "b")
+    key_new_input = cache.make_key(
+        ['st_mask', 'box', '--input', fname_input, '--output', os.path.join(tmp_path, 'out1', 'mask.nii')],
+        os.path.join(tmp_path, 'out1', 'mask.nii'))
+    assert key != key_new_input
+
+    # Results of another version of shimmingtoolbox are not reused
+    cache_upgraded = ResultCache(os.path.join(tmp_path, 'cache'), st_version='99.0')
+    key_upgraded = cache_upgraded.make_key(
+        ['st_mask', 'box', '--input', fname_input, '--output', os.path.join(tmp_path, 'out1', 'mask.nii')],
+        os.path.join(tmp_path, 'out1', 'mask.nii'))
+    assert key_upgraded != key_new_input
+
+
+def test_key_ignores_content_of_output_options(tmp_path):
+    fname_input = os.path.join(tmp_path, 'input.nii')
+    fname_mask = os.path.join(tmp_path, 'mask.nii')
+    write(fname_input, "a")
+    write(fname_mask, "previous run")
+    output = os.path.join(tmp_path, 'out')
+    command = ['st_b0shim', 'dynamic', '--fmap', fname_input, '--savemask', fname_mask, '--output', output]
+    cache = ResultCache(os.path.join(tmp_path, 'cache'))
+
+    key = cache.make_key(command, output)
+    write(fname_mask, "other run")
+    assert cache.make_key(command, output) == key
+    write(fname_input, "b")
+    assert cache.make_key(command, output) != key
+
+
+def test_store_restore(tmp_path):
+    folder = os.path.join(tmp_path, 'out1')
+    write(os.path.join(folder, 'old.txt'), "old")
+    before = snapshot(folder)
+    write(os.path.join(folder, 'sub', 'fieldmap.nii'), "fieldmap")
+    files = changed_files(folder, before)
+    assert files == [os.path.join('sub', 'fieldmap.nii')]
+
+    cache = ResultCache(os.path.join(tmp_path, 'cache'))
+    assert cache.store('key', folder, files)
+    restored = cache.restore('key', os.path.join(tmp_path, 'out2'))
+    assert restored == [os.path.join(tmp_path, 'out2', 'sub', 'fieldmap.nii')]
+    with open(restored[0]) as f:
+        assert f.read() == "fieldmap"
+    assert cache.restore('missing', folder) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    folder = os.path.join(tmp_path, 'out')
+    write(os.path.join(folder, 'a.txt'), "a" * 10)
+    cache = ResultCache(os.path.join(tmp_path, 'cache'), max_bytes=25)
+
+    cache.store('first', folder, ['a.txt'])
+    cache.store('second', folder, ['a.txt'])
+    cache.restore('first', folder)
+    cache.store('third', folder, ['a.txt'])
+
+    assert sorted(os.listdir(cache.path)) == ['first', 'third']
+
+
+def test_lookup_then_store_changes(tmp_path):
+    fname_input = os.path.join(tmp_path, 'input.nii')
+    write(fname_input, "a")
+    output = os.path.join(tmp_path, 'out', 'mask.nii')
+    command = ['st_mask', 'box', '--input', fname_input, '--output', output]
+    cache = ResultCache(os.path.join(tmp_path, 'cache'))
+
+    key, restored, before = cache.lookup(command, output)
+    assert key is not None and restored is None
+    write(output, "mask")
+    assert cache.store_changes(key, output, before)
+
+    os.remove(output)
+    assert cache.lookup(command, output) == (key, [output], None)
+    assert os.path.isfile(output)
@@ -0,0 +1,33 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import imageio
+import numpy as np
+import os
+
+from fsleyes_plugin_shimming_toolbox.components.run_component import png_to_image, read_image
+
+
+def test_read_image_converts_colour_to_gray(tmp_path):
+    fname = os.path.join(tmp_path, 'mask.png')
+    img = np.zeros([4, 5, 3], dtype=np.uint8)
+    img[1:3, 1:4] = [200, 100, 50]
+    imageio.imwrite(fname, img)
+
+    gray = read_image(fname)
+    assert gray.shape == (4, 5)
+    assert gray.dtype == np.uint8
+    assert gray[0, 0] == 0 and gray[1, 1] == 255
+
+
+def test_png_to_image_only_writes_when_persisted(tmp_path):
+    fname = os.path.join(tmp_path, 'fieldmap.png')
+    imageio.imwrite(fname, np.arange(20, dtype=np.uint8).reshape(4, 5))
+
+    image = png_to_image(fname)
+    assert image.shape[:2] == (5, 4)
+    assert image.name == 'fieldmap'
+    assert os.listdir(tmp_path) == ['fieldmap.png']
+
+    png_to_image(fname, persist=True)
+    assert os.path.isfile(os.path.join(tmp_path, 'fieldmap.nii.gz'))
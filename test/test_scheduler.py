@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from unittest import mock
+
+from fsleyes_plugin_shimming_toolbox.engine import format_cpus
+from fsleyes_plugin_shimming_toolbox.events import STATUS_CANCELLED
+from fsleyes_plugin_shimming_toolbox.scheduler import JobScheduler, Job, parse_timeouts
+
+
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.get_dispatcher')
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.wx.PostEvent')
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.get_engine')
+def test_scheduler_queues_jobs_over_budget(get_engine, post_event, get_dispatcher):
+    scheduler = JobScheduler(max_jobs=2, cpu_budget=4)
+    jobs = [Job(['st_mask', 'box'], 'st_mask box', cores=2) for _ in range(3)]
+
+    assert scheduler.submit(jobs[0])
+    assert scheduler.submit(jobs[1])
+    assert not scheduler.submit(jobs[2])
+    assert scheduler.queue_depth == 1
+    assert scheduler.cores_in_use == 4
+
+    scheduler.job_finished(jobs[0])
+    assert jobs[0].status == 'done'
+    assert jobs[2].status == 'running'
+    assert scheduler.queue_depth == 0
+    assert get_engine.return_value.submit.call_count == 3
+
+
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.get_engine')
+def test_scheduler_caps_cores_to_budget(get_engine):
+    scheduler = JobScheduler(max_jobs=2, cpu_budget=2)
+    job = Job(['st_mask', 'box'], 'st_mask box', cores=8)
+
+    assert scheduler.submit(job)
+    assert job.cores == 2
+
+
+def test_parse_timeouts():
+    timeouts = parse_timeouts("st_prepare_fieldmap=600; st_b0shim dynamic=1800.5;invalid")
+    assert timeouts == {'st_prepare_fieldmap': 600, 'st_b0shim dynamic': 1800.5}
+
+
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.get_dispatcher')
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.wx.PostEvent')
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.get_engine')
+def test_scheduler_cancel_queued_job(get_engine, post_event, get_dispatcher):
+    scheduler = JobScheduler(max_jobs=1, cpu_budget=1)
+    running = Job(['st_mask', 'box'], 'st_mask box')
+    queued = Job(['st_mask', 'box'], 'st_mask box')
+    scheduler.submit(running)
+    scheduler.submit(queued)
+
+    scheduler.cancel(queued)
+    assert scheduler.queue_depth == 0
+    assert queued.cancel_status == STATUS_CANCELLED
+    assert post_event.call_args[0][0] == get_dispatcher.return_value
+    assert post_event.call_args[0][1].get_status() == STATUS_CANCELLED
+    assert post_event.call_args[0][1].job_id == queued.id
+
+    scheduler.cancel(running)
+    get_engine.return_value.cancel.assert_called_once_with(running)
+
+
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.get_available_cpus', return_value=[0, 1, 2, 3])
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.get_dispatcher')
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.wx.PostEvent')
+@mock.patch('fsleyes_plugin_shimming_toolbox.scheduler.get_engine')
+def test_scheduler_pins_jobs_to_distinct_cpus(get_engine, post_event, get_dispatcher, get_available_cpus):
+    scheduler = JobScheduler(max_jobs=2, cpu_budget=4)
+    jobs = [Job(['st_mask', 'box'], 'st_mask box', cores=2) for _ in range(2)]
+    for job in jobs:
+        scheduler.submit(job)
+
+    assert jobs[0].cpus == [0, 1]
+    assert jobs[1].cpus == [2, 3]
+    scheduler.job_finished(jobs[0])
+    assert scheduler.free_cpus == [0, 1]
+
+
+def test_job_ids_are_unique():
+    jobs = [Job(['st_mask', 'box'], 'st_mask box') for _ in range(3)]
+    assert len({job.id for job in jobs}) == 3
+
+
+def test_format_cpus():
+    assert format_cpus([6, 0, 1, 2, 3]) == "0-3,6"
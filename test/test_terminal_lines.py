@@ -0,0 +1,35 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from fsleyes_plugin_shimming_toolbox.terminal_lines import TerminalLines
+
+
+def test_terminal_lines_spill_in_order():
+    lines = TerminalLines(max_lines=3)
+    assert lines.extend(["1", "2"]) == 0
+    assert lines.extend(["3", "4"]) == 1
+    # More new lines than fit at once, the first ones go straight to the file
+    assert lines.extend(["5", "6", "7", "8"]) == 4
+
+    assert len(lines) == 3
+    assert [lines[i] for i in range(len(lines))] == ["6", "7", "8"]
+    assert lines.n_lines_history == 5
+    with open(lines.path_history) as f:
+        assert f.read().splitlines() == ["1", "2", "3", "4", "5"]
+    lines.close()
+
+
+def test_each_terminal_has_its_own_history():
+    first = TerminalLines(max_lines=1)
+    second = TerminalLines(max_lines=1)
+    assert first.path_history != second.path_history
+
+    first.extend(["a", "b"])
+    second.extend(["c", "d"])
+    with open(first.path_history) as f:
+        assert f.read().splitlines() == ["a"]
+    with open(second.path_history) as f:
+        assert f.read().splitlines() == ["c"]
+
+    first.close()
+    second.close()
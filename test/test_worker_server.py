@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import pytest
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from fsleyes_plugin_shimming_toolbox.warm_worker import WarmWorker, WarmWorkerError
+from fsleyes_plugin_shimming_toolbox.worker_server import WorkerServer
+
+
+def st_echo(args, prog_name):
+    print(f"{prog_name} {' '.join(args)}")
+    print("error line", file=sys.stderr)
+    sys.exit(int(args[0]))
+
+
+def st_sleep(args, prog_name):
+    time.sleep(60)
+
+
+@pytest.fixture
+def warm_worker():
+    # Unix socket paths are limited to ~100 characters, tmp_path can be longer
+    tmp_dir = tempfile.mkdtemp(prefix='st_test_')
+    socket_path = os.path.join(tmp_dir, 'worker.sock')
+    server = WorkerServer(socket_path, {'st_echo': st_echo, 'st_sleep': st_sleep})
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.1}, daemon=True)
+    thread.start()
+
+    worker = WarmWorker()
+    worker.socket_path = socket_path
+    # The server runs in this process, pretend the worker process is alive
+    worker.process = mock.Mock(**{'poll.return_value': None})
+    yield worker
+
+    worker.process = None
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+async def collect(worker, cmd):
+    return [message async for message in worker.run(cmd, env=dict(os.environ), cores=2)]
+
+
+def test_worker_streams_pid_logs_and_return_code(warm_worker):
+    messages = asyncio.run(collect(warm_worker, ['st_echo', '3', 'hello']))
+
+    assert messages[0]['pid'] > 0
+    logs = [message['log'] for message in messages if 'log' in message]
+    assert logs[0].startswith('st_echo uses ')
+    assert sorted(logs[1:]) == ['error line', 'st_echo 3 hello']
+    assert messages[-1]['rc'] == 3
+    assert set(messages[-1]['rusage']) == {'user_time', 'system_time', 'max_rss'}
+    assert messages[-1]['rusage']['max_rss'] > 0
+
+
+def test_worker_logs_the_thread_policy_it_applied(warm_worker):
+    with mock.patch('fsleyes_plugin_shimming_toolbox.worker_server.threadpool_limits', None):
+        messages = asyncio.run(collect(warm_worker, ['st_echo', '0']))
+
+    logs = [message['log'] for message in messages if 'log' in message]
+    assert "threadpoolctl is not installed" in logs[0]
+
+
+def test_worker_refuses_unknown_commands(warm_worker):
+    with pytest.raises(WarmWorkerError, match="st_unknown is not available in the worker"):
+        asyncio.run(collect(warm_worker, ['st_unknown']))
+
+
+def test_worker_job_can_be_signaled_as_soon_as_its_pid_is_sent(warm_worker):
+    async def cancel_right_away():
+        messages = []
+        async for message in warm_worker.run(['st_sleep'], env=dict(os.environ)):
+            if 'pid' in message:
+                assert os.getpgid(message['pid']) == message['pid']
+                os.killpg(message['pid'], signal.SIGTERM)
+            messages.append(message)
+        return messages
+
+    messages = asyncio.run(asyncio.wait_for(cancel_right_away(), timeout=10))
+    assert messages[-1]['rc'] == -signal.SIGTERM